@@ -1,12 +1,153 @@
-from fuzzywuzzy import fuzz
+from fuzzywuzzy import fuzz, utils
+from array import array
+from collections import Counter
+from sys import intern
 from util import iterate_csv
 RATIO_MATCH = 90
 
+# Length of the q-grams used to block fuzzy match candidates
+QGRAM = 3
+
+# Number of resolved affiliation strings kept by Institutions
+INST_CACHE_SIZE = 1 << 16
+
+# q-gram postings pack the item position and the q-gram count in one int
+COUNT_BITS = 16
+COUNT_MASK = (1 << COUNT_BITS) - 1
+
+
+def fuzzy_form(s):
+    """
+    Normalized form used by fuzz.token_sort_ratio: two strings match
+    iff fuzz.ratio of their forms is above RATIO_MATCH.
+    """
+    return " ".join(sorted(utils.full_process(s, force_ascii=True).split()))
+
+
+def length_window(length, ratio=RATIO_MATCH):
+    """
+    Range of form lengths that can score above ratio against a form
+    of the given length. fuzz.ratio is at most 2 * min / (l1 + l2), and
+    it has to round to more than ratio.
+    """
+    lo = -((-(2 * ratio + 1) * length) // (399 - 2 * ratio))
+    hi = (400 * length) // (2 * ratio + 1) - length
+    return lo, hi
+
+
+def max_indel(total_length, ratio=RATIO_MATCH):
+    """ Largest indel distance that still scores above ratio """
+    return total_length * (199 - 2 * ratio) // 200
+
+
+def qgram_counts(form):
+    return Counter(form[i:i + QGRAM] for i in range(len(form) - QGRAM + 1))
+
+
+def posting(pos, count):
+    return (pos << COUNT_BITS) | min(count, COUNT_MASK)
+
+
+class MatchIndex(object):
+    """
+    Index over a list of items (Person, Institution) that returns a
+    superset of the items that can match a query, so only those are fuzzy
+    matched. Items are blocked by key, by exact normalized form and by
+    length and shared q-grams (q-gram count filter), so the answers are
+    the same as scanning every item.
+
+    q-gram postings are kept by length and q-gram, in arrays of packed
+    (position, count) ints, since PC member indexes get large.
+    """
+    __slots__ = ('exact', 'keys', 'lengths', 'grams', 'unindexed', 'unkeyed')
+
+    def __init__(self):
+        self.exact = {}
+        self.keys = {}
+        self.lengths = {}
+        self.grams = {}
+        self.unindexed = []
+        self.unkeyed = 0
+
+    def add(self, pos, item):
+        if not hasattr(item, 'match_strings'):
+            self.unindexed.append(pos)
+            return
+
+        key = item.match_key()
+        if key is None:
+            self.unkeyed += 1
+        else:
+            self.keys.setdefault(key, []).append(pos)
+
+        for s in item.match_strings():
+            form = fuzzy_form(s)
+            self.exact.setdefault(form, []).append(pos)
+            if not form:
+                continue
+            length = len(form)
+            self.lengths.setdefault(length, []).append(pos)
+            grams = self.grams.setdefault(length, {})
+            for g, c in qgram_counts(form).items():
+                postings = grams.get(g)
+                if postings is None:
+                    postings = grams[intern(g)] = array('q')
+                postings.append(posting(pos, c))
+
+    def candidates(self, item):
+        if isinstance(item, str):
+            s = item
+            key = None
+        else:
+            s = item.match_strings()[0]
+            key = item.match_key()
+
+        if key is not None:
+            yield from self.keys.get(key, [])
+            # Two keyed items only match on their keys
+            if not self.unkeyed:
+                yield from self.unindexed
+                return
+
+        form = fuzzy_form(s)
+        yield from self.exact.get(form, [])
+        if form:
+            yield from self.fuzzy_candidates(form)
+        yield from self.unindexed
+
+    def fuzzy_candidates(self, form):
+        l1 = len(form)
+        lo, hi = length_window(l1)
+        grams = None
+        for l2 in range(lo, hi + 1):
+            if l2 not in self.lengths:
+                continue
+
+            threshold = max(l1, l2) - QGRAM + 1 - QGRAM * max_indel(l1 + l2)
+            if threshold <= 0:
+                yield from self.lengths[l2]
+                continue
+
+            if grams is None:
+                grams = qgram_counts(form)
+            shared = {}
+            postings = self.grams[l2]
+            for g, c in grams.items():
+                for p in postings.get(g, ()):
+                    pos = p >> COUNT_BITS
+                    shared[pos] = shared.get(pos, 0) + min(c, p & COUNT_MASK)
+            for pos, n in shared.items():
+                if n >= threshold:
+                    yield pos
+
 
 class Person(object):
+    __slots__ = ('name', 'key', 'info', 'has_key')
+
     def __init__(self, name, key="", info=""):
-        self.name = name
-        self.key = key
+        # The same names and keys come up in many publications
+        self.name = intern(name)
+        self.key = intern(key) if key else key
         self.info = info
         if not key:
             self.has_key = False
@@ -18,7 +159,7 @@ class Person(object):
 
     def set_key(self, key):
         self.has_key = True
-        self.key = key
+        self.key = intern(key) if key else key
 
     def match(self, person):
         if isinstance(person, Person) and self.has_key and person.has_key:
@@ -28,6 +169,12 @@ class Person(object):
             return True
         return False
 
+    def match_strings(self):
+        return [self.name]
+
+    def match_key(self):
+        return self.key if self.has_key else None
+
     def __str__(self):
         info_str = (" : %s" % str(self.info)) if self.info else ""
         key_str = (" : %s" % self.key) if self.has_key else ""
@@ -35,31 +182,97 @@ class Person(object):
 
 
 class Institution(object):
-    def __init__(self, list_inst):
+    __slots__ = ('list_inst', 'id')
+
+    def __init__(self, list_inst, id=None):
         self.list_inst = list_inst
+        self.id = id
 
     def match(self, inst):
+        if (isinstance(inst, Institution) and
+           self.id is not None and inst.id is not None):
+            return self.id == inst.id
         str_inst = inst if isinstance(inst, str) else inst.list_inst[0]
         for i in self.list_inst:
             if fuzz.token_sort_ratio(i, str_inst) > RATIO_MATCH:
                 return True
         return False
 
+    def match_strings(self):
+        return self.list_inst
+
+    def match_key(self):
+        return self.id
+
     def __str__(self):
         return self.list_inst[0]
 
 
 class Institutions(object):
-    def __init__(self, csv):
+    """
+    Resolves affiliation strings to canonical institution IDs. Rows of the
+    institutions csv get IDs in file order, and strings that do not match
+    any row get new IDs, shared with the unknown strings they match.
+    """
+    def __init__(self, csv, cache_size=INST_CACHE_SIZE):
         insts = {}
         for i in iterate_csv(csv):
             insts[i[0]] = i
         self.insts = insts
+        self.rows = [Institution(l, idx)
+                     for idx, l in enumerate(insts.values())]
+        self.index = MatchIndex()
+        self.aliases = {}
+        for row in self.rows:
+            self.index.add(row.id, row)
+            for alias in row.list_inst:
+                self.aliases.setdefault(fuzzy_form(alias), row.id)
+
+        self.unknown = []
+        self.unknown_index = MatchIndex()
+        self.cache_size = cache_size
+        self.resolved = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __find_row(self, inst):
+        """ First row with an alias that matches inst, as in file order """
+        exact = self.aliases.get(fuzzy_form(inst))
+        for idx in sorted(set(self.index.candidates(inst))):
+            if exact is not None and idx >= exact:
+                break
+            if self.rows[idx].match(inst):
+                return idx
+        return exact
+
+    def __find_unknown(self, inst):
+        for idx in sorted(set(self.unknown_index.candidates(inst))):
+            if self.unknown[idx].match(inst):
+                return self.unknown[idx].id
+
+        u = Institution([inst], len(self.rows) + len(self.unknown))
+        self.unknown_index.add(len(self.unknown), u)
+        self.unknown.append(u)
+        return u.id
+
+    def get_id(self, inst):
+        if inst in self.resolved:
+            self.hits += 1
+            return self.resolved[inst]
+
+        self.misses += 1
+        idx = self.__find_row(inst)
+        if idx is None:
+            idx = self.__find_unknown(inst)
+
+        if len(self.resolved) >= self.cache_size:
+            del self.resolved[next(iter(self.resolved))]
+        self.resolved[inst] = idx
+        return idx
 
     def get_inst(self, inst):
-        for k, l in self.insts.items():
-            for i in l:
-                if fuzz.token_sort_ratio(i, inst) > RATIO_MATCH:
-                    return Institution(l)
+        idx = self.get_id(inst)
+        if idx < len(self.rows):
+            return self.rows[idx]
 
-        return Institution([inst])
+        return Institution([inst], idx)
@@ -0,0 +1,207 @@
+"""
+    Times the stages of cross_reference_conflicts on synthetic conferences
+    (see synthetic_conference.py) of increasing size.
+
+    Each size runs in a fresh process, so caches and peak memory of one
+    size don't leak into the next.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tracemalloc
+from collections import Counter
+import profiler
+
+DEFAULT_SIZES = '300x50,1000x150,3000x400'
+
+# Objects counted by the memory benchmark
+COUNTED_TYPES = ['Person', 'PCMember', 'Institution', 'Publication',
+                 'Submission', 'BaseConflicts', 'ConflictSet', 'MatchIndex']
+
+
+def peak_memory_mb():
+    """ Peak RSS of this process and of its (pool) children """
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024.
+
+
+def run(conference_dir, workers):
+    """ Runs the pipeline on a generated conference, returns the results """
+    import cross_reference_conflicts as crc
+    from base import Institutions
+    from conflict import parse_line
+    from dblp_crawler import use_cache
+    from util import get_dict_json
+
+    timer = profiler.enable()
+    path = lambda f: os.path.join(conference_dir, f)
+    use_cache(path('dblp_cache.db'))
+
+    with timer.stage('institutions'):
+        institutions = Institutions(path('institutions.csv'))
+    with timer.stage('read_submissions'):
+        submissions = crc.read_submissions(path('submissions.json'),
+                                           institutions)
+    with timer.stage('read_pc_members'):
+        hotcrp = crc.read_pc_members(path('pc_info.csv'), institutions)
+    with timer.stage('read_pc_papers'):
+        dblp, publications = crc.read_pc_papers(path('pc_papers.csv'),
+                                                hotcrp, institutions)
+    with timer.stage('cross_reference'):
+        crc.cross_reference_all(submissions, hotcrp, dblp, workers)
+    with timer.stage('reports'):
+        for conflict_type in ['proper', 'collaborators_field',
+                              'declared_by_pc_members', 'dblp',
+                              'fake_conflicts']:
+            crc.print_reports(submissions, conflict_type,
+                              path('report_%s.csv' % conflict_type))
+
+    # Micro benchmarks on the strings of the conference
+    affiliations = [a['affiliation']
+                    for s in get_dict_json(path('submissions.json'))
+                    for a in s['authors']]
+    lines = [l for s in get_dict_json(path('submissions.json'))
+             for l in s['collaborators'].split('\n') if l]
+    with timer.stage('micro_get_inst_cold'):
+        institutions = Institutions(path('institutions.csv'))
+        for a in affiliations:
+            institutions.get_inst(a)
+    with timer.stage('micro_get_inst_warm'):
+        for a in affiliations:
+            institutions.get_inst(a)
+    with timer.stage('micro_parse_line'):
+        for l in lines:
+            try:
+                parse_line(l)
+            except ValueError:
+                pass
+
+    # ReportWriter adds up its time per report into accumulated stages,
+    # which are already part of the reports stage
+    stages = [s for s in timer.stages if s['stage'] not in timer.accumulated]
+    return {'conference': conference_dir,
+            'submissions': len(submissions),
+            'pc_members': len(hotcrp),
+            'publications': len(publications.pubs),
+            'workers': workers,
+            'stages': stages,
+            'total_seconds': sum(s['seconds'] for s in stages
+                                 if not s['stage'].startswith('micro')),
+            'fuzzy_calls': sum(timer.fuzzy_calls.values()),
+            'peak_memory_mb': peak_memory_mb()}
+
+
+def measure_memory(conference_dir):
+    """
+    Memory held by the loaded inputs (PC members, their publications and
+    the submissions), as traced by tracemalloc, and their object counts.
+    """
+    import cross_reference_conflicts as crc
+    from base import Institutions
+    from dblp_crawler import use_cache
+
+    path = lambda f: os.path.join(conference_dir, f)
+    use_cache(path('dblp_cache.db'))
+    institutions = Institutions(path('institutions.csv'))
+
+    tracemalloc.start()
+    hotcrp = crc.read_pc_members(path('pc_info.csv'), institutions)
+    dblp, publications = crc.read_pc_papers(path('pc_papers.csv'),
+                                            hotcrp, institutions)
+    submissions = crc.read_submissions(path('submissions.json'),
+                                       institutions)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    objects = Counter(type(o).__name__ for o in gc.get_objects())
+    return {'conference': conference_dir,
+            'submissions': len(submissions),
+            'pc_members': len(hotcrp),
+            'publications': len(publications.pubs),
+            'loaded_mb': current / 2. ** 20,
+            'peak_loading_mb': peak / 2. ** 20,
+            'objects': {t: objects[t] for t in COUNTED_TYPES}}
+
+
+def print_memory_results(results):
+    for r in results:
+        print("\n%d submissions x %d PC members, %d publications: "
+              "%.1f MB loaded, %.1f MB peak while loading" %
+              (r['submissions'], r['pc_members'], r['publications'],
+               r['loaded_mb'], r['peak_loading_mb']))
+        for t, n in r['objects'].items():
+            print("    %-24s %10d" % (t, n))
+
+
+def print_results(results):
+    for r in results:
+        print("\n%d submissions x %d PC members, %d publications, "
+              "%d worker(s): %.2fs, %d fuzzy matches, %.1f MB peak" %
+              (r['submissions'], r['pc_members'], r['publications'],
+               r['workers'], r['total_seconds'], r['fuzzy_calls'],
+               r['peak_memory_mb']))
+        for s in r['stages']:
+            print("    %-24s %8.3fs %10d" % (s['stage'], s['seconds'],
+                                              s['fuzzy_calls']))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Comma separated PAPERSxPC_MEMBERS sizes")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default='data/benchmark',
+                        help="Folder of the generated conferences")
+    parser.add_argument("--json", help="Also save the results to this file")
+    parser.add_argument("--memory", action='store_true',
+                        help="Measure the memory of the loaded inputs "
+                        "instead of timing the stages")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process: run a single conference and report on stdout
+        if args.memory:
+            result = measure_memory(args.run)
+        else:
+            result = run(args.run, args.workers)
+        sys.stdout.write("\nRESULT " + json.dumps(result) + "\n")
+        return
+
+    from synthetic_conference import generate
+    results = []
+    for size in args.sizes.split(','):
+        n_papers, n_pc_members = [int(n) for n in size.split('x')]
+        conference_dir = os.path.join(args.data_dir, '%s_%d' %
+                                      (size, args.seed))
+        if not os.path.exists(os.path.join(conference_dir,
+                                           'dblp_cache.db')):
+            print("Generating %s" % conference_dir)
+            generate(conference_dir, n_papers, n_pc_members, args.seed)
+
+        print("Running %s" % conference_dir)
+        out = subprocess.run([sys.executable, __file__, '--run',
+                              conference_dir, '--workers', str(args.workers)] +
+                             (['--memory'] if args.memory else []),
+                             stdout=subprocess.PIPE, check=True,
+                             universal_newlines=True).stdout
+        results.append(json.loads(out.rsplit("\nRESULT ", 1)[1]))
+
+    if args.memory:
+        print_memory_results(results)
+    else:
+        print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+    Counts the citations that each submission makes to PC members, to be
+    read by paper_affinity.py. The text of each submission PDF is
+    extracted with pdftotext, and the files are processed by a pool of
+    processes.
+
+    Extracted texts are cached by the hash of their PDF, and citation
+    counts by the hash of the text and of the PC list, so re-runs only
+    extract new or updated PDFs and, after a PC change, only redo the
+    matching.
+
+    Matching follows WordCnt_And_Reference_Logger/paperparser.pl: after the
+    first word containing 'References' (or 'REFERENCES'), a PC member is
+    cited each time a word is their last name (optionally followed by ','
+    or '.') and one of the two words before it is their first name or
+    first initial, e.g., 'Daniel Sanchez', 'D. Sanchez' or
+    'T. N. Vijaykumar'.
+"""
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from multiprocessing import Pool
+from os import listdir, cpu_count, makedirs
+from os.path import join, splitext, dirname
+from subprocess import Popen, PIPE
+from tqdm import tqdm
+from util import iterate_csv, transliterate
+
+REFERENCES = ['REFERENCES', 'References']
+CITATIONS_HEADER = "pc_key,refs\n"
+PAPER_RE = re.compile(r"paper(\d+)\.(pdf|txt)$")
+CACHE_PATH = 'data/.cache_citations.db'
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        chunk = f.read(HASH_CHUNK_SIZE)
+        while chunk:
+            h.update(chunk)
+            chunk = f.read(HASH_CHUNK_SIZE)
+    return h.hexdigest()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8', 'replace')).hexdigest()
+
+
+class CitationCache(object):
+    """
+    Extracted texts by PDF hash and citation counts by (text hash, PC list
+    hash), stored in a SQLite database.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        if dirname(path):
+            makedirs(dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS texts "
+                        "(pdf_hash TEXT PRIMARY KEY, text BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS citations "
+                        "(text_hash TEXT, pc_hash TEXT, counts TEXT, "
+                        "PRIMARY KEY (text_hash, pc_hash))")
+        self.db.commit()
+
+    def get_text(self, pdf_hash):
+        with self.lock:
+            row = self.db.execute("SELECT text FROM texts WHERE pdf_hash = ?",
+                                  (pdf_hash,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def add_text(self, pdf_hash, text):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO texts VALUES (?, ?)",
+                            (pdf_hash, zlib.compress(text.encode('utf-8'))))
+            self.db.commit()
+
+    def get_counts(self, t_hash, pc_hash):
+        with self.lock:
+            row = self.db.execute("SELECT counts FROM citations "
+                                  "WHERE text_hash = ? AND pc_hash = ?",
+                                  (t_hash, pc_hash)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_counts(self, t_hash, pc_hash, counts):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO citations "
+                            "VALUES (?, ?, ?)",
+                            (t_hash, pc_hash, json.dumps(counts)))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def references_start(text):
+    """ Position of the word that opens the references, or None """
+    positions = [p for p in (text.find(r) for r in REFERENCES) if p >= 0]
+    if not positions:
+        return None
+    p = min(positions)
+    while p > 0 and not text[p - 1].isspace():
+        p -= 1
+    return p
+
+
+class PCNames(object):
+    """
+    Name variants of the PC members, by the words (last names) that end a
+    citation, so each word of a reference list is looked up once for all
+    PC members.
+    """
+    def __init__(self, pc_members):
+        pc_members = [tuple(p) for p in pc_members]
+        # Cached counts are only valid for the same PC list
+        self.hash = hashlib.sha256(
+            json.dumps(pc_members).encode('utf-8')).hexdigest()
+        self.emails = []
+        self.by_last = {}
+        for idx, (first, last, email) in enumerate(pc_members):
+            self.emails.append(email)
+            if not last:
+                continue
+            initial = first[:1] + '.' if first else None
+            for word in [last, last + ',', last + '.']:
+                self.by_last.setdefault(word, []).append((idx, first,
+                                                          initial))
+
+    @classmethod
+    def from_hotcrp_csv(cls, pc_csv):
+        """ First, last name and email of a HotCRP PC info csv """
+        return cls(iterate_csv(pc_csv, encoding='utf-8', columns=[0, 1, 2]))
+
+    def count(self, text):
+        """ Citations to each PC member in text, in PC member order """
+        counts = [0] * len(self.emails)
+        start = references_start(text)
+        if start is None:
+            return counts
+
+        w0 = w1 = ''
+        for w2 in transliterate(text[start:]).split():
+            for idx, first, initial in self.by_last.get(w2, ()):
+                if (w1 == initial or w0 == initial or
+                   w1 == first or w0 == first):
+                    counts[idx] += 1
+            w0, w1 = w1, w2
+        return counts
+
+    def write_counts(self, counts, citations_csv):
+        with open(citations_csv, 'w') as f:
+            f.write(CITATIONS_HEADER)
+            for email, count in zip(self.emails, counts):
+                if count:
+                    f.write("%s,%d\n" % (email, count))
+
+
+def pdf_to_text(pdf):
+    """ Text of pdf, None if pdftotext fails """
+    process = Popen(["pdftotext", pdf, "-"], stdout=PIPE)
+    output, _ = process.communicate()
+    if process.wait():
+        print("WARNING: couldn't parse %s" % pdf)
+        return None
+    return output.decode('utf-8', 'replace')
+
+
+def submission_files(folder):
+    """ {pid: (pdf or None, txt)} of the paperN.pdf/txt files in folder """
+    files = {}
+    for f in sorted(listdir(folder)):
+        m = PAPER_RE.search(f)
+        if not m:
+            continue
+        pid = int(m.group(1))
+        base = join(folder, splitext(f)[0])
+        pdf = files.get(pid, (None, None))[0]
+        if m.group(2) == 'pdf':
+            pdf = base + '.pdf'
+        files[pid] = (pdf, base + '.txt')
+    return files
+
+
+# PC names and cache of a worker process, set up once by init_worker
+pc_names = None
+worker_cache = None
+
+
+def init_worker(names, cache_path):
+    global pc_names, worker_cache
+    pc_names = names
+    # Workers only read the cache, new entries are added by the parent
+    worker_cache = CitationCache(cache_path)
+
+
+def count_citations(task):
+    """
+    Writes the citation counts of a submission. Returns the pid, whether it
+    succeeded, and the text and counts to add to the cache, if new.
+    """
+    pid, pdf, txt, citations_csv = task
+    new_text = None
+    if pdf is not None:
+        pdf_hash = file_hash(pdf)
+        text = worker_cache.get_text(pdf_hash)
+        if text is None:
+            text = pdf_to_text(pdf)
+            if text is None:
+                return pid, False, None, None
+            new_text = (pdf_hash, text)
+    else:
+        with open(txt, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+
+    t_hash = text_hash(text)
+    counts = worker_cache.get_counts(t_hash, pc_names.hash)
+    new_counts = None
+    if counts is None:
+        counts = pc_names.count(text)
+        new_counts = (t_hash, pc_names.hash, counts)
+    pc_names.write_counts(counts, citations_csv)
+    return pid, True, new_text, new_counts
+
+
+def extract_citations(pc_csv, folder, out_dir=None, workers=None,
+                      cache_path=CACHE_PATH):
+    """
+    Writes out_dir/paperN.csv for each paperN.pdf (or paperN.txt, if
+    there is no pdf) in folder. Returns the pids that failed.
+    """
+    names = PCNames.from_hotcrp_csv(pc_csv)
+    out_dir = out_dir or folder
+    makedirs(out_dir, exist_ok=True)
+    tasks = [(pid, pdf, txt, join(out_dir, "paper%d.csv" % pid))
+             for pid, (pdf, txt) in submission_files(folder).items()]
+
+    cache = CitationCache(cache_path)
+    stats = Counter()
+    failed = []
+    with Pool(workers or cpu_count(), init_worker,
+              (names, cache_path)) as pool:
+        for pid, ok, new_text, new_counts in tqdm(
+                pool.imap_unordered(count_citations, tasks, 4),
+                total=len(tasks)):
+            if not ok:
+                failed.append(pid)
+                continue
+            if new_text is not None:
+                cache.add_text(*new_text)
+                stats['extracted'] += 1
+            if new_counts is not None:
+                cache.add_counts(*new_counts)
+                stats['matched'] += 1
+    cache.close()
+
+    print("%d papers: %d texts extracted, %d matched against the PC, "
+          "the rest from the cache" %
+          (len(tasks), stats['extracted'], stats['matched']))
+    return sorted(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pc_csv", help="csv from hotcrp with the pc info")
+    parser.add_argument("pdf_folder",
+                        help="Folder with the submissions (paperN.pdf)")
+    parser.add_argument("--out-dir",
+                        help="Folder for the paperN.csv citation counts, "
+                        "the pdf folder by default")
+    parser.add_argument("--workers", type=int,
+                        help="Number of processes, all cpus by default")
+    parser.add_argument("--cache", default=CACHE_PATH,
+                        help="Cache of extracted texts and citation counts")
+    args = parser.parse_args()
+
+    failed = extract_citations(args.pc_csv, args.pdf_folder, args.out_dir,
+                               args.workers, args.cache)
+    if failed:
+        print("Couldn't extract the text of papers: %s" %
+              ", ".join(str(pid) for pid in failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from base import Person, Institutions
+from base import Person, Institutions, MatchIndex
 import re
 
 
@@ -47,24 +47,61 @@ def parse_line(line):
 
 
 class ConflictSet(object):
+    __slots__ = ('_d', '_reasons', '_index')
+
     def __init__(self, value=None):
         self._d = []
-        self._reasons = []
+        # Reasons by position, only the non-empty ones
+        self._reasons = {}
+        # Built on the first lookup, see _get_index
+        self._index = None
         if value:
-            self._d.append(value)
-            self._reasons.append("")
-
-    def __contains__(self, item):
-        for i in self._d:
-            if i.match(item):
+            self._append(value, "")
+
+    def __getstate__(self):
+        # The index is rebuilt on demand, no need to ship it around
+        return None, {'_d': self._d, '_reasons': self._reasons,
+                      '_index': None}
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = MatchIndex()
+            for pos, item in enumerate(self._d):
+                self._index.add(pos, item)
+        return self._index
+
+    def drop_index(self):
+        """ Frees the index of a set that is only iterated from now on """
+        self._index = None
+
+    def _append(self, item, reason):
+        if self._index is not None:
+            self._index.add(len(self._d), item)
+        if reason:
+            self._reasons[len(self._d)] = reason
+        self._d.append(item)
+
+    def _items(self):
+        for pos, item in enumerate(self._d):
+            yield item, self._reasons.get(pos, "")
+
+    def _find(self, item):
+        seen = set()
+        for pos in self._get_index().candidates(item):
+            if pos in seen:
+                continue
+            seen.add(pos)
+            if self._d[pos].match(item):
                 return True
 
         return False
 
+    def __contains__(self, item):
+        return self._find(item)
+
     def match(self, item):
-        for i in self._d:
-            if i.match(item):
-                return "%s" % (str(item))
+        if self._find(item):
+            return "%s" % (str(item))
 
         return False
 
@@ -74,12 +111,12 @@ class ConflictSet(object):
         for i in self._d:
             if i in other:
                 intersection.add(i)
-                intersection_str.append(other.match(i))
+                intersection_str.append("%s" % (str(i)))
 
         return zip(intersection, intersection_str)
 
     def merge(self, other):
-        for c, r in zip(other._d, other._reasons):
+        for c, r in other._items():
             self.add(c, r)
 
     def add(self, item, reason=""):
@@ -87,8 +124,7 @@ class ConflictSet(object):
             return
 
         if item not in self:
-            self._d.append(item)
-            self._reasons.append(reason)
+            self._append(item, reason)
 
     def __iter__(self):
         for d in self._d:
@@ -99,7 +135,7 @@ class ConflictSet(object):
             return ""
 
         s = ""
-        for i,r in zip(self._d, self._reasons):
+        for i, r in self._items():
             if r:
                 s += ("- %s; %s\n" % (str(i), r))
             else:    
@@ -112,7 +148,7 @@ class ConflictSet(object):
             return ""
 
         s = ""
-        for i, r in zip(self._d, self._reasons):
+        for i, r in self._items():
             # if r:
             #    s += ("(%s: %s);" % (str(i), r))
             # else:
@@ -124,6 +160,8 @@ class ConflictSet(object):
         return True if self._d else False
 
 class BaseConflicts(object):
+    __slots__ = ('collabs', 'institutions', 'insts', 'bad_data')
+
     def __init__(self, institution, collaborators_str=""):
         """ Parse collaborators string """
         self.collabs = ConflictSet()
@@ -161,17 +199,18 @@ class BaseConflicts(object):
             p = Person(a)
         self.collabs.add(p)
 
-    def __inst_conflicts(self, other):
-        return self.institutions.intersects_with(other.institutions)
-
     def __collab_conflicts(self, other):
         return self.collabs.intersects_with(other.collabs)
 
+    def institution_ids(self):
+        return set(i.id for i in self.institutions)
+
     def find_institution_conflicts(self, other):
         out = BaseConflicts(self.insts)
-        for i in self.__inst_conflicts(other):
-            inst, r = i
-            out.institutions.add(inst, r)
+        other_ids = other.institution_ids()
+        for inst in self.institutions:
+            if inst.id in other_ids:
+                out.institutions.add(inst, str(inst))
         return out
 
     def find_collab_conflicts(self, other):
@@ -0,0 +1,207 @@
+"""
+    Paper x PC member conflicts as a bit matrix, built once from the
+    validated cross-reference reports and shared by the tools that only
+    need to know whether a PC member is conflicted with a paper
+    (assignment, meeting order, HotCRP export).
+
+    Each paper is a row of bits, one per PC member, and the matrix is
+    saved as a small JSON header (the pids and emails) followed by the
+    raw rows, so load() can memory map it.
+"""
+import argparse
+import json
+import struct
+import numpy as np
+from util import iterate_csv, iterate_json_list
+
+MAGIC = b'COIBITS1'
+HEADER_ALIGN = 8
+
+
+def read_report_conflicts(report_csvs):
+    """ (pid, email) pairs marked as valid in cross-reference reports """
+    conflicts = set()
+    for report in report_csvs:
+        for row in iterate_csv(report):
+            # Reports are edited by hand, skip blank and short rows
+            if len(row) < 3 or row[0].strip() != 'x':
+                continue
+            conflicts.add((int(row[1]), row[2].strip()))
+    return conflicts
+
+
+class ConflictMatrix(object):
+    """
+    Conflicts of pids (rows) with emails (columns). Lookups, rows and
+    columns are bit operations on the packed rows, and |, & and - combine
+    matrices over the same pids and emails.
+    """
+    def __init__(self, pids, emails, bits=None):
+        self.pids = list(pids)
+        self.emails = list(emails)
+        self.rows = {pid: i for i, pid in enumerate(self.pids)}
+        self.cols = {email: i for i, email in enumerate(self.emails)}
+        if bits is None:
+            bits = np.zeros((len(self.pids), (len(self.emails) + 7) // 8),
+                            dtype=np.uint8)
+        self.bits = bits
+
+    @classmethod
+    def from_pairs(cls, pairs, pids=None, emails=None):
+        """
+        Matrix of the (pid, email) pairs. Rows and columns are the given
+        pids and emails, or the ones in pairs, and other pairs are dropped.
+        """
+        pairs = list(pairs)
+        if pids is None:
+            pids = sorted(set(pid for pid, _ in pairs))
+        if emails is None:
+            emails = sorted(set(email for _, email in pairs))
+        matrix = cls(pids, emails)
+        for pid, email in pairs:
+            if pid in matrix.rows and email in matrix.cols:
+                matrix.add(pid, email)
+        return matrix
+
+    @classmethod
+    def from_reports(cls, report_csvs, pids=None, emails=None):
+        return cls.from_pairs(read_report_conflicts(report_csvs), pids,
+                              emails)
+
+    def add(self, pid, email):
+        col = self.cols[email]
+        self.bits[self.rows[pid], col >> 3] |= 1 << (col & 7)
+
+    def __contains__(self, pair):
+        pid, email = pair
+        row = self.rows.get(pid)
+        col = self.cols.get(email)
+        if row is None or col is None:
+            return False
+        return bool((self.bits[row, col >> 3] >> (col & 7)) & 1)
+
+    def row(self, pid):
+        """ bool array of the PC members conflicted with pid """
+        return np.unpackbits(self.bits[self.rows[pid]],
+                             count=len(self.emails),
+                             bitorder='little').astype(bool)
+
+    def column(self, email):
+        """ bool array of the papers conflicted with email """
+        col = self.cols[email]
+        return ((self.bits[:, col >> 3] >> (col & 7)) & 1).astype(bool)
+
+    def emails_of(self, pid):
+        return [self.emails[c] for c in np.flatnonzero(self.row(pid))]
+
+    def pids_of(self, email):
+        return [self.pids[r] for r in np.flatnonzero(self.column(email))]
+
+    def to_array(self):
+        """ pids x emails bool array """
+        return np.unpackbits(self.bits, axis=1, count=len(self.emails),
+                             bitorder='little').astype(bool)
+
+    def reindex(self, pids, emails):
+        """ pids x emails bool array, False for unknown pids or emails """
+        dense = self.to_array()
+        out = np.zeros((len(pids), len(emails)), dtype=bool)
+        rows = [(i, self.rows[pid]) for i, pid in enumerate(pids)
+                if pid in self.rows]
+        cols = [(j, self.cols[email]) for j, email in enumerate(emails)
+                if email in self.cols]
+        if rows and cols:
+            out_rows, rows = zip(*rows)
+            out_cols, cols = zip(*cols)
+            out[np.ix_(out_rows, out_cols)] = dense[np.ix_(rows, cols)]
+        return out
+
+    def __iter__(self):
+        """ (pid, email) pairs, by pid and then by email """
+        dense = self.to_array()
+        for row, col in zip(*np.nonzero(dense)):
+            yield self.pids[row], self.emails[col]
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def _combine(self, other, bits):
+        if self.pids != other.pids or self.emails != other.emails:
+            raise ValueError("Conflict matrices of different papers or "
+                             "PC members")
+        return ConflictMatrix(self.pids, self.emails, bits)
+
+    def __or__(self, other):
+        return self._combine(other, self.bits | other.bits)
+
+    def __and__(self, other):
+        return self._combine(other, self.bits & other.bits)
+
+    def __sub__(self, other):
+        return self._combine(other, self.bits & ~other.bits)
+
+    def save(self, path):
+        header = json.dumps({'pids': self.pids,
+                             'emails': self.emails}).encode('utf-8')
+        start = len(MAGIC) + 8 + len(header)
+        header += b' ' * (-start % HEADER_ALIGN)
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            f.write(np.ascontiguousarray(self.bits).tobytes())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """ Matrix saved at path, with its bits memory mapped (read only) """
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a conflict matrix" % path)
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length).decode('utf-8'))
+        offset = len(MAGIC) + 8 + length
+        shape = (len(header['pids']), (len(header['emails']) + 7) // 8)
+        if mmap and shape[0] * shape[1]:
+            bits = np.memmap(path, dtype=np.uint8, mode='r', offset=offset,
+                             shape=shape)
+        else:
+            bits = np.fromfile(path, dtype=np.uint8, offset=offset,
+                               count=shape[0] * shape[1]).reshape(shape)
+        return cls(header['pids'], header['emails'], bits)
+
+    def write_hotcrp_csv(self, hotcrp_csv):
+        """ HotCRP bulk assignment csv with the conflicts """
+        with open(hotcrp_csv, 'w') as f:
+            f.write("paper,assignment,email\n")
+            for pid, email in self:
+                f.write("%d,conflict,%s\n" % (pid, email))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_matrix", help="Conflict matrix file")
+    parser.add_argument("reports", nargs='+',
+                        help="Cross-reference reports, only the conflicts "
+                        "marked as valid are used")
+    parser.add_argument("--hotcrp-csv",
+                        help="Also write the conflicts as a HotCRP csv")
+    parser.add_argument("--submissions",
+                        help="json from hotcrp with the submissions, to "
+                        "have a row for every paper. Otherwise only the "
+                        "papers with conflicts have rows")
+    args = parser.parse_args()
+
+    pids = None
+    if args.submissions:
+        pids = sorted(int(s['pid'])
+                      for s in iterate_json_list(args.submissions, ['pid']))
+    matrix = ConflictMatrix.from_reports(args.reports, pids)
+    matrix.save(args.out_matrix)
+    print("%d conflicts between %d papers and %d PC members" %
+          (len(matrix), len(matrix.pids), len(matrix.emails)))
+    if args.hotcrp_csv:
+        matrix.write_hotcrp_csv(args.hotcrp_csv)
+
+
+if __name__ == '__main__':
+    main()
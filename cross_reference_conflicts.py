@@ -1,8 +1,16 @@
-from util import iterate_csv, get_dict_json
+from util import iterate_csv, iterate_csv_batches
 from tqdm import tqdm
 from base import Institutions
-from pc_members import Publication, Submission, PCMember
-import sys
+from pc_members import (PublicationRegistry, PairConflicts, Submission,
+                        PCMember)
+from dblp_crawler import (prefetch_publications, save_cache, use_cache,
+                          cache_path)
+from multiprocessing import Pool
+import dblp_crawler
+import profiler
+import argparse
+import csv
+import gc
 
 
 def print_conflict_list(l):
@@ -14,84 +22,260 @@ def print_conflict_list(l):
     return s
 
 
-def print_reports(sub_list, conflict_type, report_file):
-    csv_list = []
-    for s in tqdm(sub_list):
-        csv_list += s.conflicts_csv(conflict_type)
+REPORT_HEADER = ['valid', 'pid', 'email', 'reasons']
 
-    str_out = "valid, pid, email, reasons\n"
-    str_out += "\n".join(csv_list)
-    with open(report_file, 'w') as f:
-        f.write(str_out)
 
+class ReportWriter(object):
+    """
+    Streams the conflicts of each submission into the report of every
+    conflict type, so reports are written in one pass over the submissions,
+    as they are cross referenced.
+    """
+    def __init__(self, report_files):
+        self.files = {}
+        self.writers = {}
+        for conflict_type, report_file in report_files:
+            f = open(report_file, 'w', newline='')
+            self.files[conflict_type] = f
+            self.writers[conflict_type] = csv.writer(f)
+            self.writers[conflict_type].writerow(REPORT_HEADER)
 
-def main():
-    institutions_csv = sys.argv[1]
-    submissions_json = sys.argv[2]
-    hotcrp_pc_member_csv = sys.argv[3]
-    pc_member_paper_db_csv = sys.argv[4]
-
-    out_proper = sys.argv[5]
-    out_paper_collabs_field = sys.argv[6]
-    out_pc_collabs_field = sys.argv[7]
-    out_dblp = sys.argv[8]
-    out_fake = sys.argv[9]
-    # Step 1: read all the inputs (institutions_csv, paper data from hotcrp,
-    # pc info from hotcrp and paper db from dblp):
-    print("Reading institutions csv...")
-    institutions = Institutions(institutions_csv)
+    def write(self, submission):
+        for conflict_type, writer in self.writers.items():
+            with profiler.accumulate('report: %s' % conflict_type):
+                writer.writerows(submission.conflict_rows(conflict_type))
 
-    print("Reading submissions:")
-    d = get_dict_json(submissions_json)
-    submissions = [Submission.from_json(p, institutions) for p in tqdm(d)]
+    def close(self):
+        for f in self.files.values():
+            f.close()
 
-    print("Reading hotcrp pc members:")
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def print_reports(sub_list, conflict_type, report_file):
+    with ReportWriter([(conflict_type, report_file)]) as writer:
+        for s in tqdm(sub_list):
+            writer.write(s)
+
+
+def read_submissions(submissions_json, institutions):
+    return list(tqdm(Submission.iterate_json(submissions_json, institutions)))
+
+
+def read_pc_members(hotcrp_pc_member_csv, institutions):
     hotcrp_pc_members = [PCMember.from_hotcrp_csv(line, institutions)
                          for line in tqdm(iterate_csv(hotcrp_pc_member_csv,
                                                       encoding='utf-8'))]
-    hotcrp_pc_members = {p.email: p for p in hotcrp_pc_members}
+    return {p.email: p for p in hotcrp_pc_members}
 
-    print("Reading pc papers:")
+
+def read_pc_papers(pc_member_paper_db_csv, hotcrp_pc_members, institutions):
+    """
+    Returns the pc members with the conflicts from their valid DBLP papers,
+    and the publication registry they were read from.
+    """
     dblp_pc_members = {k: p.copy_no_conflicts()
                        for k, p in hotcrp_pc_members.items()}
 
-    for row in tqdm(iterate_csv(pc_member_paper_db_csv)):
-        (email, id, firstname, lastname, keys, valid,
-         pub_key, pub_title, pub_year, pub_authors) = row
+    # Columns: email, id, first name, last name, keys, valid, pub key,
+    # pub title, pub year and pub authors. Only email, valid and pub key
+    # are read, and only the valid rows are kept, a batch at a time.
+    paper_rows = []
+    for batch in iterate_csv_batches(pc_member_paper_db_csv,
+                                     columns=[0, 5, 6]):
+        paper_rows += [(email, pub_key) for email, valid, pub_key in batch
+                       if valid == "x"]
+    print("Fetching pc papers missing from the cache:")
+    prefetch_publications(dict.fromkeys(pub_key for _, pub_key
+                                        in paper_rows), True)
+    save_cache()
 
-        if valid == "x":
-            pub = Publication.from_key(pub_key, institutions)
-            dblp_pc_members[email].add_publication(pub)
+    publications = PublicationRegistry(institutions)
+    for email, pub_key in tqdm(paper_rows):
+        pub = publications.get(pub_key)
+        dblp_pc_members[email].add_publication(pub)
 
-    print("Cross referencing conflicts")
-    for s in tqdm(submissions):
-        # Step 2: list conflicts that are declared by authors properly
-        # Step 3: list conflicts that are declared by authors
-        #         in the collaborators field
-        for k, v in hotcrp_pc_members.items():
-            s.add_collaborator_conflict(v)
+    return dblp_pc_members, publications
+
+
+def cross_reference(s, hotcrp_pc_members, dblp_pc_members):
+    # Steps 2 to 6 are evaluated together for each pc member:
+    # Step 2: list conflicts that are declared by authors properly
+    # Step 3: list conflicts that are declared by authors
+    #         in the collaborators field
+    # Step 4: list conflicts declared by pc members but undeclared
+    #         by paper authors
+    # Step 5: list conflicts not declared by anyone but caught by dblp
+    # Step 6: list conflicts declared by authors that can't be verified
+    for k, v in hotcrp_pc_members.items():
+        s.add_pc_member_conflicts(v, dblp_pc_members[k])
+
+
+# Submissions and PC members of a worker process, shipped once by init_worker
+worker_data = None
+
+
+def init_worker(submissions, hotcrp_pc_members, dblp_pc_members,
+                profiling=False):
+    global worker_data
+    worker_data = (submissions, hotcrp_pc_members, dblp_pc_members)
+    if profiling:
+        # Only report what this worker measures
+        profiler.enable().reset()
 
-        # Step 4: list conflicts declared by pc members but undeclared
-        # by paper authors
-        for k, v in hotcrp_pc_members.items():
-            s.add_conflicts_from_pc_member(v)
 
-        # Step 5: list conflicts not declared by anyone but caught by dblp
-        for k, v in dblp_pc_members.items():
-            s.add_conflicts_from_dblp(v)
+def cross_reference_worker(idx):
+    submissions, hotcrp_pc_members, dblp_pc_members = worker_data
+    s = submissions[idx]
+    with profiler.submission(s.pid):
+        cross_reference(s, hotcrp_pc_members, dblp_pc_members)
+    counts = (profiler.profile.take_counts()
+              if profiler.profile is not None else None)
+    return s.get_conflict_lists(), counts
 
-        # Step 6:
-        for k, v in dblp_pc_members.items():
-            s.add_fake_conflicts(hotcrp_pc_members[k], v)
 
-    print_reports(submissions, 'proper', out_proper)
-    print_reports(submissions, 'collaborators_field', out_paper_collabs_field)
-    print_reports(submissions, 'declared_by_pc_members', out_pc_collabs_field)
-    print_reports(submissions, 'dblp', out_dblp)
-    print_reports(submissions, 'fake_conflicts', out_fake)
+def iter_cross_reference(submissions, hotcrp_pc_members, dblp_pc_members,
+                         workers=1):
+    """
+    Cross references the submissions, yielding each one, in order, as soon
+    as its conflict lists are complete. Serial runs read submissions from
+    the iterable as they go.
+    """
+    if workers <= 1:
+        for s in tqdm(submissions):
+            with profiler.submission(s.pid):
+                cross_reference(s, hotcrp_pc_members, dblp_pc_members)
+            yield s
+        return
 
+    # Workers get all the submissions up front
+    submissions = list(submissions)
+    # Keep forked workers from copying the inputs when gc touches them
+    gc.freeze()
+    chunksize = max(1, len(submissions) // (workers * 8))
+    try:
+        with Pool(workers, init_worker,
+                  (submissions, hotcrp_pc_members, dblp_pc_members,
+                   profiler.profile is not None)) as pool:
+            # imap keeps submission order, so reports match a serial run
+            results = pool.imap(cross_reference_worker,
+                                range(len(submissions)), chunksize)
+            for s, (lists, counts) in tqdm(zip(submissions, results),
+                                           total=len(submissions)):
+                s.set_conflict_lists(lists)
+                if counts is not None:
+                    profiler.profile.merge_counts(counts)
+                yield s
+    finally:
+        gc.unfreeze()
+
+
+def cross_reference_all(submissions, hotcrp_pc_members, dblp_pc_members,
+                        workers=1):
+    for _ in iter_cross_reference(submissions, hotcrp_pc_members,
+                                  dblp_pc_members, workers):
+        pass
+
+
+def instrument(profile):
+    """ Functions whose time --profile reports (inclusive) """
+    profile.time_function(Institutions, 'get_id', 'institution resolution')
+    profile.time_function(Submission, 'from_json', 'submission parsing')
+    profile.time_function(PublicationRegistry, 'get', 'publication loading')
+    profile.time_function(dblp_crawler, 'publication_record',
+                          'DBLP record parsing')
+    profile.time_function(Submission, 'add_collaborator_conflict',
+                          'step 3: submission collaborators field')
+    # Once per pair, the hotcrp and dblp results are memoized
+    profile.time_function(PairConflicts, 'match_hotcrp',
+                          'steps 2, 4, 6: HotCRP PC member conflicts')
+    profile.time_function(PairConflicts, 'match_dblp',
+                          'steps 5, 6: DBLP PC member conflicts')
+    profile.time_function(ReportWriter, 'write', 'report writing')
+
+
+def cache_stats(institutions, publications):
+    """ (hits, misses) of the caches used in a run """
+    stats = {'institutions': (institutions.hits, institutions.misses),
+             'publication_registry': (publications.hits,
+                                      publications.misses)}
+    if dblp_crawler.cache is not None:
+        c = dblp_crawler.cache.stats
+        stats['dblp_queries'] = (c['query_hits'], c['query_misses'])
+        stats['dblp_records'] = (c['record_hits'], c['record_misses'])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("institutions_csv")
+    parser.add_argument("submissions_json")
+    parser.add_argument("hotcrp_pc_member_csv")
+    parser.add_argument("pc_member_paper_db_csv")
+    parser.add_argument("out_proper")
+    parser.add_argument("out_paper_collabs_field")
+    parser.add_argument("out_pc_collabs_field")
+    parser.add_argument("out_dblp")
+    parser.add_argument("out_fake")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to cross reference "
+                        "submissions")
+    parser.add_argument("--cache", default=cache_path,
+                        help="DBLP query cache")
+    parser.add_argument("--profile",
+                        help="Write stage times, match counts and cache hit "
+                        "rates of the run to this JSON file")
+    args = parser.parse_args()
+    use_cache(args.cache)
+    if args.profile:
+        instrument(profiler.enable())
+
+    # Step 1: read the inputs (institutions_csv, pc info from hotcrp and
+    # paper db from dblp). Paper data from hotcrp is streamed below.
+    print("Reading institutions csv...")
+    with profiler.stage('read institutions'):
+        institutions = Institutions(args.institutions_csv)
+
+    print("Reading hotcrp pc members:")
+    with profiler.stage('read hotcrp pc members'):
+        hotcrp_pc_members = read_pc_members(args.hotcrp_pc_member_csv,
+                                            institutions)
+
+    print("Reading pc papers:")
+    with profiler.stage('read pc papers'):
+        dblp_pc_members, publications = read_pc_papers(
+            args.pc_member_paper_db_csv, hotcrp_pc_members, institutions)
+    print("Publication registry: %s" % publications)
+
+    # Submissions are read while they are cross referenced, and reports
+    # written, so --profile adds up these stages over the submissions
+    submissions = profiler.iterate('read submissions',
+                                   Submission.iterate_json(
+                                       args.submissions_json, institutions))
+
+    print("Cross referencing conflicts")
+    reports = [('proper', args.out_proper),
+               ('collaborators_field', args.out_paper_collabs_field),
+               ('declared_by_pc_members', args.out_pc_collabs_field),
+               ('dblp', args.out_dblp),
+               ('fake_conflicts', args.out_fake)]
+    with profiler.stage('cross reference and reports'):
+        with ReportWriter(reports) as writer:
+            for s in iter_cross_reference(submissions, hotcrp_pc_members,
+                                          dblp_pc_members, args.workers):
+                writer.write(s)
+                # Only the reports need the conflicts
+                s.clear_conflict_lists()
+
+    if args.profile:
+        profiler.profile.save(args.profile,
+                              cache_stats(institutions, publications))
+        print("Profile saved to %s" % args.profile)
 
 
 if __name__ == '__main__':
     main()
-
@@ -1,114 +1,344 @@
 # -*- coding: utf-8 -*-
 import urllib.request
 import xmltodict
-from time import sleep
+from time import sleep, time, monotonic
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from tqdm import tqdm
 from os import remove, rename
 from os.path import exists
 import os.path
-from util import read_csv, write_csv, copy_dic
+from util import read_csv, write_csv, copy_dic, iterate_csv_batches
+from dblp_dump import DumpStore, ingest
 import unidecode
 import html
 import argparse
 import pickle
+import threading
+import email.utils
+import sqlite3
+import json
+
+DBLP_URL = os.environ.get('DBLP_URL', 'http://dblp.uni-trier.de/')
+CACHE_PATH = 'data/.cache_queries.db'
+# Bump when publication_record changes, to re-parse cached publications
+RECORD_VERSION = 1
 
 
 def sanitize_text(text):
     text = unidecode.unidecode(html.unescape(text.decode('ascii')))
     return text.replace("&", " ")
 
+class LegacyCache(object):
+    """ Stand-in for the pickled Cache objects of older versions """
+    pass
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if name == 'Cache':
+            return LegacyCache
+        return super().find_class(module, name)
+
+
 class Cache(object):
-    def __init__(self, path='data/.cache_queries'):
-        self.backup_ctr = 0
+    """
+    Raw DBLP responses, stored in a SQLite database. Each response is
+    committed when it is added, and lookups only read the entries they
+    need.
+    """
+    def __init__(self, path=CACHE_PATH):
         self.path = path
-        self.queries = {}
-
-    def backup(self):
-        if os.path.exists(self.path):
-            backupname = self.path + ".bak"
-            if os.path.exists(backupname):
-                os.remove(backupname)
-            os.rename(self.path, backupname)
-
-    def backup_and_save(self, force=False):
-        self.backup_ctr += 1
-        if self.backup_ctr % 100 == 0 or force:
-            self.backup()
-            with  open(self.path, "wb") as f:
-                pickle.dump(self, f, -1)
+        self.lock = threading.Lock()
+        # Lookup hits and misses, by table
+        self.stats = Counter()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS queries "
+                        "(query TEXT PRIMARY KEY, response BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS publications "
+                        "(key TEXT PRIMARY KEY, version INTEGER, record TEXT)")
+        self.db.commit()
+
+    def migrate(self, legacy_path):
+        """ Copies the queries of a pickled cache into this one """
+        with open(legacy_path, "rb") as f:
+            legacy = LegacyUnpickler(f).load()
+        queries = getattr(legacy, 'queries', legacy)
+        self.add_queries(queries.items())
+        return len(queries)
 
     @classmethod
-    def load(cls, path):
-        if os.path.exists(path):
-            try:
-                with open(path, "rb") as f:
-                    cache = pickle.load(f, errors="strict")
-                return cache
-            except Exception as ex:
-                print("Problem loading paper cache, with exception",
-                      ex.__class__.__name__,
-                      "if this persists, re-create %s" % path)
-                raise ex
+    def load(cls, path=CACHE_PATH, legacy_path=None):
+        """
+        Opens the cache at path. A new cache imports the pickled cache of
+        older versions, by default path without the .db extension.
+        """
+        if legacy_path is None and path.endswith('.db'):
+            legacy_path = path[:-len('.db')]
+        if not os.path.exists(path):
+            if legacy_path and os.path.exists(legacy_path):
+                cls.migrate_to(legacy_path, path)
+            else:
+                print("Cache not found, creating")
+        return cls(path)
 
-        else:
-            print("Cache not found, creating")
-            return cls(path)
+    @classmethod
+    def migrate_to(cls, legacy_path, path):
+        """
+        Migrates the pickled cache into a temporary database that is only
+        renamed to path once complete, so a failed migration is retried.
+        """
+        print("Migrating %s to %s" % (legacy_path, path))
+        tmp_path = path + '.migrating'
+        for f in [tmp_path, tmp_path + '-wal', tmp_path + '-shm']:
+            if os.path.exists(f):
+                remove(f)
+        tmp = cls(tmp_path)
+        n = tmp.migrate(legacy_path)
+        tmp.close()
+        os.replace(tmp_path, path)
+        print("Migrated %d queries" % n)
+
+    def save(self):
+        with self.lock:
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
 
     def __contains__(self, key):
-        return key in self.queries
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM queries WHERE query = ?",
+                                   (key,)).fetchone() is not None
 
     def add_query(self, key, response):
-        if key not in self.queries:
-            self.queries[key] = response
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO queries VALUES (?, ?)",
+                            (key, response))
+            self.db.commit()
+
+    def add_queries(self, items):
+        """ Adds many (query, response) pairs in one transaction """
+        with self.lock:
+            self.db.executemany("INSERT OR IGNORE INTO queries VALUES (?, ?)",
+                                items)
+            self.db.commit()
 
     def get_query(self, key):
-        if key in self.queries:
-            return self.queries[key]
-        else:
-            return None
-
+        with self.lock:
+            row = self.db.execute("SELECT response FROM queries "
+                                  "WHERE query = ?", (key,)).fetchone()
+            self.stats['query_hits' if row else 'query_misses'] += 1
+        return row[0] if row else None
+
+    def add_publication(self, key, record):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO publications "
+                            "VALUES (?, ?, ?)",
+                            (key, RECORD_VERSION, json.dumps(record)))
+            self.db.commit()
+
+    def has_publication(self, key):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM publications "
+                                   "WHERE key = ? AND version = ?",
+                                   (key, RECORD_VERSION)).fetchone() is not None
+
+    def get_publication(self, key):
+        """ Publication record of key, None if missing or outdated """
+        with self.lock:
+            row = self.db.execute("SELECT record FROM publications "
+                                  "WHERE key = ? AND version = ?",
+                                  (key, RECORD_VERSION)).fetchone()
+            self.stats['record_hits' if row else 'record_misses'] += 1
+        return json.loads(row[0]) if row else None
+
+
+# The cache is only opened when a query needs it, see get_cache
+cache = None
+cache_path = os.environ.get('DBLP_CACHE', CACHE_PATH)
+cache_lock = threading.Lock()
+
+
+def use_cache(path):
+    """ Queries are cached at path from now on """
+    global cache, cache_path
+    with cache_lock:
+        if cache is not None:
+            cache.close()
+        cache = None
+        cache_path = path
+
+
+def get_cache():
+    global cache
+    if cache is None:
+        with cache_lock:
+            if cache is None:
+                cache = Cache.load(cache_path)
+    return cache
 
-cache = Cache.load('data/.cache_queries')
 
 def save_cache():
-    cache.backup_and_save(True)
+    if cache is not None:
+        cache.save()
+
+
+def parse_retry_after(value, default=60):
+    """ Retry-After is either a number of seconds or an HTTP date """
+    if value is None:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0, date.timestamp() - time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by all fetching threads. pause() stops every thread
+    for a while, e.g. when DBLP answers with 429.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.last = monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(self.burst, self.tokens +
+                                      (now - self.last) * self.rate)
+                    self.last = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+            self.tokens = 0
+
+
+class Fetcher(object):
+    """
+    Fetches raw DBLP responses through the cache, with at most `workers`
+    requests in flight and `rate` requests per second overall.
+    """
+    def __init__(self, url=DBLP_URL, workers=8, rate=10.0, retries=5):
+        self.configure(url, workers, rate, retries)
+
+    def configure(self, url=None, workers=None, rate=None, retries=None):
+        if url is not None:
+            self.url = url if url.endswith('/') else url + '/'
+        if workers is not None:
+            self.workers = max(1, workers)
+            self.slots = threading.BoundedSemaphore(self.workers)
+        if rate is not None:
+            self.limiter = RateLimiter(rate, self.workers)
+        if retries is not None:
+            self.retries = retries
+
+    def fetch(self, query):
+        raw_str = get_cache().get_query(query)
+        if raw_str is not None:
+            return raw_str
+
+        url = self.url + query
+        for _ in range(self.retries):
+            self.limiter.acquire()
+            try:
+                with self.slots:
+                    with urllib.request.urlopen(url) as resource:
+                        raw_str = resource.read()
+            except urllib.error.HTTPError as err:
+                if err.code != 429:
+                    raise err
+                wait = parse_retry_after(err.headers['Retry-After'])
+                print("HTTP error code", err.code, "reason:", err.reason,
+                      "will wait:", wait)
+                self.limiter.pause(wait + 1)
+                continue
 
+            get_cache().add_query(query, raw_str)
+            return raw_str
 
-def request_dblp(query):
-    url = ('http://dblp.uni-trier.de/%s' % query)
+        # woops we failed
+        raise Exception("Something wrong happened, we run out of tries")
+
+    def map(self, func, items, progress=False):
+        """ Ordered map of func over items, run on `workers` threads """
+        items = list(items)
+        if self.workers <= 1 or len(items) <= 1:
+            results = map(func, items)
+            return list(tqdm(results, total=len(items)) if progress
+                        else results)
+
+        with ThreadPoolExecutor(min(self.workers, len(items))) as executor:
+            results = executor.map(func, items)
+            return list(tqdm(results, total=len(items)) if progress
+                        else results)
 
-    num_retries = 2
-    while num_retries > 0:
-        try:
-            if query in cache:
-                raw_str = cache.get_query(query)
-            else:
-                resource = urllib.request.urlopen(url)
-                raw_str = resource.read()
-                cache.add_query(query, raw_str)
-                cache.backup_and_save()
-
-            raw_str = sanitize_text(raw_str)
-            return xmltodict.parse(raw_str)
-
-        except urllib.error.HTTPError as err:
-            if err.code == 429:
-                print("HTTP error code", err.code, "reason:", err.reason, "will wait:", err.headers['Retry-After'])
-                wait = int(err.headers['Retry-After'])
-                sleep(wait + 10)
-                num_retries -= 1
-            else:
-                raise err
-        except Exception as err:
-            print("Something bad happend:", str(err))
-            print(raw_str)
-            raise err
 
-    # woops we failed
-    raise Exception("Something wrong happened, we run out of tries")
+fetcher = Fetcher()
+
+# DumpStore that answers queries instead of DBLP, see use_dump
+dump = None
+
+
+def use_dump(path):
+    """ Reads DBLP data from the DumpStore at path instead of the network """
+    global dump
+    if not os.path.exists(path):
+        raise ValueError("DBLP dump database %s not found, create it with "
+                         "the ingest-dump mode" % path)
+    dump = DumpStore(path)
+
+
+if os.environ.get('DBLP_DUMP_DB'):
+    use_dump(os.environ['DBLP_DUMP_DB'])
+
+
+def request_dblp(query):
+    raw_str = fetcher.fetch(query)
+    try:
+        return xmltodict.parse(sanitize_text(raw_str))
+    except Exception as err:
+        print("Something bad happend:", str(err))
+        print(raw_str)
+        raise err
 
 
 def request_author_key(author):
+    if dump is not None:
+        return dump.author_keys(author) or ['']
+
     data = request_dblp('search/author?xauthor="%s"' %
                         author.replace(' ', '+'))
     # TODO DOES NOT WORK IF THE PERSON HAS ALIASES
@@ -125,6 +355,9 @@ def make_author_link(key):
 
 
 def request_publication_keys(author_key):
+    if dump is not None:
+        return dump.publication_keys(author_key)
+
     data = request_dblp('rec/pers/%s/xk' %
                         author_key)
     return data['dblpperson']['dblpkey'][1:]
@@ -172,23 +405,191 @@ def read_pub(pub_xml):
 
 
 #http://dblp.uni-trier.de/rec/rdf/conf/isca/KannanGGS17.rdf
+def publication_queries(key):
+    return ['rec/bibtex/%s.xml' % key, 'rec/rdf/%s.rdf' % key]
+
+
+def prefetch_publications(keys, progress=False):
+    """ Warms up the cache with the publications in keys, concurrently """
+    if dump is not None:
+        return
+
+    queries = [q for key in keys if not get_cache().has_publication(key)
+               for q in publication_queries(key) if q not in get_cache()]
+    fetcher.map(fetcher.fetch, queries, progress)
+
+
+def record_documents(record):
+    """ bibtex XML and RDF documents (as parsed by request_dblp) of a record """
+    pub = {'@key': record['key'], 'title': record['title'],
+           'year': str(record['year'])}
+    if record['authors']:
+        pub['author'] = record['authors']
+    if record['edited']:
+        rdf_pub = {'dblp:editedBy': []}
+    else:
+        rdf_pub = {'dblp:authoredBy': [{'@rdf:resource':
+                                        'http://dblp.org/pers/%s' % k}
+                                       for k in record['author_keys']]}
+    return ({'dblp': {'article': pub}},
+            {'rdf:RDF': {'dblp:Publication': [{}, rdf_pub]}})
+
+
 def request_publication(key):
-    xmldict = request_dblp('rec/bibtex/%s.xml' % key)
-    rdfdict = request_dblp('rec/rdf/%s.rdf' % key)
-    return xmldict, rdfdict
+    if dump is not None:
+        record = dump.publication_record(key)
+        return record_documents(record) if record else (None, None)
+
+    prefetch_publications([key])
+    xml_query, rdf_query = publication_queries(key)
+    return request_dblp(xml_query), request_dblp(rdf_query)
+
+
+def publication_record(xml, rdf):
+    """
+    Normalized publication: key, title, year, author names, author DBLP
+    keys (None when they can't be matched to the names) and whether the
+    publication is edited (e.g., proceedings).
+    """
+    pub_type = list(xml['dblp'].keys())[0]
+    key = xml['dblp'][pub_type]['@key']
+    year = int(xml['dblp'][pub_type]['year'])
+    title = sanitize_titles(xml['dblp'][pub_type]['title'])
+
+    if 'dblp:editedBy' in rdf['rdf:RDF']['dblp:Publication'][1]:
+        return {'key': key, 'title': title, 'year': year, 'edited': True,
+                'authors': [], 'author_keys': []}
+
+    # Scrap authors from rdf file
+    try:
+        authors_list = rdf['rdf:RDF']['dblp:Publication'][1]['dblp:authoredBy']
+        if isinstance(authors_list, list):
+            author_keys = [i['@rdf:resource'][21:]
+                           for i in authors_list
+                           if i['@rdf:resource'].startswith('http://dblp.org/pers/')]
+        else:
+            author_keys = (authors_list['@rdf:resource'][21:]
+                           if authors_list['@rdf:resource'].startswith('http://dblp.org/pers/')
+                           else [])
+    except Exception as ex:
+        print("Bad rdf:")
+        print(rdf['rdf:RDF']['dblp:Publication'][1])
+        raise ex
+
+    if 'author' in xml['dblp'][pub_type]:
+        authors = sanitize_coauthors(xml['dblp'][pub_type]['author'])
+    else:
+        authors = []
+
+    if len(author_keys) == len(authors):
+        author_keys = list(author_keys)
+    else:
+        author_keys = [None] * len(authors)
+
+    return {'key': key, 'title': title, 'year': year, 'edited': False,
+            'authors': authors, 'author_keys': author_keys}
+
+
+def request_publication_record(key):
+    """ Publication record of key, parsed only once and cached """
+    if dump is not None:
+        return dump.publication_record(key)
+
+    record = get_cache().get_publication(key)
+    if record is None:
+        xml, rdf = request_publication(key)
+        if not xml:
+            return None
+        record = publication_record(xml, rdf)
+        get_cache().add_publication(key, record)
+    return record
+
 
 def request_publications(author_key):
     pubs = []
     publication_keys = request_publication_keys(author_key)
+    prefetch_publications(publication_keys, True)
 
-    for key in tqdm(publication_keys):
-        pub, _ = request_publication(key)
-        if pub:
-            pubs.append(read_pub(pub))
+    for key in publication_keys:
+        record = request_publication_record(key)
+        if record:
+            pubs.append({k: record[k]
+                         for k in ['key', 'title', 'year', 'authors']})
 
     return pubs
 
 
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def person_author_keys(person, author_key):
+    """
+    Person keys of the names in a person record: the person's own names
+    and the co-author list, which has the urlpt of each co-author.
+    """
+    keys = {person['@name']: author_key}
+    if isinstance(person.get('person'), dict):
+        for name in as_list(person['person'].get('author', [])):
+            keys[name if isinstance(name, str) else name['#text']] = author_key
+
+    coauthors = person.get('coauthors') or {}
+    for co in as_list(coauthors.get('co', [])):
+        for na in as_list(co['na']):
+            if isinstance(na, dict) and '@f' in na:
+                keys[na['#text']] = na['@f']
+    return keys
+
+
+def person_publication_record(pub, keys):
+    """ Same record as publication_record, from a person record entry """
+    key = pub['@key']
+    year = int(pub['year'])
+    title = sanitize_titles(pub['title'])
+
+    if 'editor' in pub:
+        return {'key': key, 'title': title, 'year': year, 'edited': True,
+                'authors': [], 'author_keys': []}
+
+    if 'author' in pub:
+        authors = sanitize_coauthors(pub['author'])
+    else:
+        authors = []
+
+    author_keys = [keys.get(a) for a in authors]
+    if None in author_keys:
+        author_keys = [None] * len(authors)
+
+    return {'key': key, 'title': title, 'year': year, 'edited': False,
+            'authors': authors, 'author_keys': author_keys}
+
+
+def request_person_publications(author_key, year):
+    """
+    Publications of author_key from year on, from the person's full record
+    (one request), instead of 1 + 2 requests per publication. The records
+    are cached, so Publication.from_key won't fetch them again.
+    """
+    if dump is not None:
+        return filter_publications(request_publications(author_key), year)
+
+    person = request_dblp('rec/pers/%s/xx' % author_key)['dblpperson']
+    keys = person_author_keys(person, author_key)
+
+    pubs = []
+    for r in as_list(person.get('r', [])):
+        pub = list(r.values())[0]
+        if int(pub['year']) < year:
+            continue
+        record = get_cache().get_publication(pub['@key'])
+        if record is None:
+            record = person_publication_record(pub, keys)
+            get_cache().add_publication(pub['@key'], record)
+        pubs.append({k: record[k] for k in ['key', 'title', 'year', 'authors']})
+
+    return filter_publications(pubs, year)
+
+
 def is_blacklisted(blacklist, key):
     for b in blacklist:
         if b in key:
@@ -206,13 +607,14 @@ def filter_publications(publications, year):
 
 
 def get_author_keys(author_list):
-    authors = read_csv(author_list, ["first_name", "last_name"])
+    authors = {a['id']: a for a in read_csv(author_list,
+                                            ["first_name", "last_name"])}
 
-    for author in tqdm(authors.items()):
-        keys = request_author_key(author["first_name"] + "+" +
-                                  author["last_name"])
-        author["keys"] = keys
+    def request_keys(author):
+        author["keys"] = request_author_key(author["first_name"] + "+" +
+                                            author["last_name"])
 
+    fetcher.map(request_keys, authors.values(), True)
     return authors
 
 
@@ -240,7 +642,7 @@ def build_paper_csv(pub_list, authors, whitelist):
     write_csv(pub_list, schema, csv)
 
 
-def get_paper_list(author_keys, year):
+def get_paper_list(author_keys, year, person_records=False):
     author_keys = read_csv(author_keys, ['first_name', 'last_name',
                                          'key', 'valid', 'key_link'])
     authors = {}
@@ -254,6 +656,19 @@ def get_paper_list(author_keys, year):
         elif entry['valid']:
             authors[idx]['keys'].append(entry['key'])
 
+    author_keys = sorted(set(k for v in authors.values() for k in v['keys']))
+    if person_records:
+        print("fetching person records")
+        pubs = fetcher.map(lambda k: request_person_publications(k, year),
+                           author_keys, True)
+        pubs = dict(zip(author_keys, pubs))
+        for v in authors.values():
+            v['pubs'] = [p for k in v['keys'] for p in pubs[k]]
+        return authors
+
+    print("fetching publication keys")
+    fetcher.map(request_publication_keys, author_keys, True)
+
     print("looping over authors")
     for idx, v in authors.items():
         print(v)
@@ -267,30 +682,33 @@ def get_paper_list(author_keys, year):
 
 
 def get_co_authors(paper_csv):
-    papers = read_csv(paper_csv, ['first_name', 'last_name',
-                                  'keys', 'valid', 'pub_key', 'pub_title',
-                                  'put_year', 'pub_authors'])
+    # Columns: id, first name, last name, keys, valid, pub key, pub title,
+    # pub year and pub authors. The year is not read, and rows are
+    # processed a batch at a time instead of as one list of dicts.
     papers_dic = {}
-    for p in papers:
-        a_id = int(p['id'])
-        if a_id not in papers_dic:
-            papers_dic[a_id] = {}
-            papers_dic[a_id]['first_name'] = p['first_name']
-            papers_dic[a_id]['last_name'] = p['last_name']
-            papers_dic[a_id]['keys'] = set([p['keys']])
-            papers_dic[a_id]['pubs'] = []
-            papers_dic[a_id]['co-authors'] = {}
-
-        a_dic = papers_dic[a_id]
-
-        if p['valid']:
-            pub = (p['pub_key'], p['pub_title'])
-            a_dic['pubs'].append(pub)
-            for co_a in p['pub_authors'].split(";"):
-                if co_a not in a_dic['co-authors']:
-                    a_dic['co-authors'][co_a] = [pub]
-                else:
-                    a_dic['co-authors'][co_a].append(pub)
+    for batch in iterate_csv_batches(paper_csv,
+                                     columns=[0, 1, 2, 3, 4, 5, 6, 8]):
+        for (a_id, first_name, last_name, keys, valid, pub_key, pub_title,
+             pub_authors) in batch:
+            a_id = int(a_id)
+            if a_id not in papers_dic:
+                papers_dic[a_id] = {}
+                papers_dic[a_id]['first_name'] = first_name
+                papers_dic[a_id]['last_name'] = last_name
+                papers_dic[a_id]['keys'] = set([keys])
+                papers_dic[a_id]['pubs'] = []
+                papers_dic[a_id]['co-authors'] = {}
+
+            a_dic = papers_dic[a_id]
+
+            if valid:
+                pub = (pub_key, pub_title)
+                a_dic['pubs'].append(pub)
+                for co_a in pub_authors.split(";"):
+                    if co_a not in a_dic['co-authors']:
+                        a_dic['co-authors'][co_a] = [pub]
+                    else:
+                        a_dic['co-authors'][co_a].append(pub)
 
     return papers_dic
 
@@ -298,7 +716,8 @@ def get_co_authors(paper_csv):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("mode", choices=["author-keys", "paper-lists",
-                                         "list-co-authors", "get-conflicts"])
+                                         "list-co-authors", "get-conflicts",
+                                         "ingest-dump"])
     parser.add_argument("--author-list", help="List with author names")
     parser.add_argument("--author-keys",
                         help="List with author keys to be searched")
@@ -309,6 +728,24 @@ def main():
                         default=2012,
                         help="Last acceptable year for"
                         "collaboration without conflict")
+    parser.add_argument("--dblp-url", default=DBLP_URL,
+                        help="DBLP server to query")
+    parser.add_argument("--fetch-workers", type=int, default=8,
+                        help="Maximum number of concurrent DBLP requests")
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="Maximum number of DBLP requests per second "
+                        "(0 for no limit)")
+    parser.add_argument("--cache", default=cache_path,
+                        help="DBLP query cache (default: $DBLP_CACHE or %s)"
+                        % CACHE_PATH)
+    parser.add_argument("--person-records", action="store_true",
+                        help="Get the papers of each author from their "
+                        "full DBLP record, with one request per author")
+    parser.add_argument("--dump",
+                        help="DBLP XML dump (dblp.xml.gz) to ingest")
+    parser.add_argument("--dump-db",
+                        help="Database built from the DBLP dump. When "
+                        "given, DBLP queries are answered from it")
 
     # These optaions are not implemented yet
     parser.add_argument("--pc-conflicts",
@@ -324,12 +761,24 @@ def main():
                         " generate the conflict list")
 
     args = parser.parse_args()
+    use_cache(args.cache)
+    fetcher.configure(args.dblp_url, args.fetch_workers, args.rate)
 
     def check_arg(arg, msg):
         if not arg:
             parser.print_help()
             raise ValueError(msg)
 
+    if args.mode == 'ingest-dump':
+        check_arg(args.dump, "No DBLP dump passed")
+        check_arg(args.dump_db, "No dump database passed")
+
+        ingest(args.dump, args.dump_db).close()
+        return
+
+    if args.dump_db:
+        use_dump(args.dump_db)
+
     if args.mode == 'author-keys':
         check_arg(args.author_list, "No author list passed")
 
@@ -341,7 +790,8 @@ def main():
         check_arg(args.paper_list, "No paper list passed")
 
         authors = get_paper_list(args.author_keys,
-                                 args.co_author_year)
+                                 args.co_author_year,
+                                 args.person_records)
         # build_paper_csv(args.paper_list, authors, args.drop_conf_whitelist)
         build_paper_csv(args.paper_list, authors, True)
 
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+    Local copy of DBLP built from the official XML dump
+    (https://dblp.org/xml/dblp.xml.gz), so the crawler can answer author,
+    publication key and publication queries offline.
+
+    The dump is parsed as a stream: only the record being read is kept in
+    memory, and records are written to a SQLite database in batches.
+"""
+import gzip
+import html.entities
+import json
+import re
+import sqlite3
+import threading
+import xml.etree.ElementTree as ET
+from os import remove
+from os.path import exists
+import unidecode
+from tqdm import tqdm
+
+RECORD_TYPES = set(['article', 'inproceedings', 'proceedings', 'book',
+                    'incollection', 'phdthesis', 'mastersthesis', 'www'])
+RECORD_FIELDS = set(['author', 'editor', 'title', 'year'])
+
+# Records written per transaction while ingesting
+BATCH_SIZE = 10000
+CHUNK_SIZE = 1 << 20
+
+
+def sanitize_str(text):
+    """ Same normalization sanitize_text applies to DBLP responses """
+    return unidecode.unidecode(text).replace("&", " ")
+
+
+def encode_char(c):
+    """ urlpt of a character: non-ASCII letters become =entity= """
+    if c.isascii() and (c.isalnum() or c == '_'):
+        return c
+    if c == ' ':
+        return '_'
+    name = html.entities.codepoint2name.get(ord(c))
+    return '=%s=' % name if name else '='
+
+
+def encode_name_part(part):
+    return ''.join(encode_char(c) for c in part)
+
+
+def person_key(name):
+    """
+    DBLP person key (urlpt) of a name as written in the dump, e.g.
+    'Mario Drumond' -> 'd/Drumond:Mario', 'Wei Wang 0001' ->
+    'w/Wang_0001:Wei' and 'Jürgen Müller' -> 'm/M=uuml=ller:J=uuml=rgen',
+    so the keys match the ones of the DBLP API.
+    """
+    parts = name.split()
+    if not parts:
+        return ''
+    number = (parts.pop()
+              if len(parts) > 1 and parts[-1].isdigit() else None)
+    last = encode_name_part(parts[-1])
+    if number:
+        last += '_' + number
+    first = encode_name_part(' '.join(parts[:-1]))
+    initial = unidecode.unidecode(parts[-1][:1])[:1].lower()
+    initial = initial if initial.isalpha() else '='
+    return '%s/%s:%s' % (initial, last, first)
+
+
+class DumpHandler(object):
+    """ Parser target that hands complete records to a DumpStore """
+    def __init__(self, store):
+        self.store = store
+        self.record = None
+        self.field = None
+        self.text = []
+        self.count = 0
+
+    def start(self, tag, attrib):
+        if self.record is None:
+            if tag in RECORD_TYPES:
+                self.record = {'type': tag, 'key': attrib.get('key', ''),
+                               'author': [], 'author_keys': [], 'editor': [],
+                               'title': '', 'year': None}
+        elif self.field is None and tag in RECORD_FIELDS:
+            self.field = tag
+            self.text = []
+
+    def data(self, data):
+        if self.field is not None:
+            self.text.append(data)
+
+    def end(self, tag):
+        if self.field == tag:
+            text = ''.join(self.text).strip()
+            value = sanitize_str(text).strip()
+            if tag == 'author':
+                # Keys come from the name before sanitize_str, which drops
+                # the accents DBLP keeps as entities
+                self.record['author'].append(value)
+                self.record['author_keys'].append(person_key(text))
+            elif tag == 'editor':
+                self.record['editor'].append(value)
+            elif tag == 'title':
+                self.record['title'] = value
+            elif tag == 'year' and value.isdigit():
+                self.record['year'] = int(value)
+            self.field = None
+        elif self.record is not None and tag == self.record['type']:
+            self.store.add_record(self.record)
+            self.record = None
+            self.count += 1
+
+    def close(self):
+        return self.count
+
+
+class DumpStore(object):
+    """
+    SQLite database with the persons, name aliases, publications and
+    authorships of a DBLP dump.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.persons = []
+        self.aliases = []
+        self.publications = []
+        self.authorships = []
+
+    @classmethod
+    def create(cls, path):
+        if exists(path):
+            remove(path)
+        store = cls(path)
+        store.db.executescript("""
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            CREATE TABLE persons (key TEXT PRIMARY KEY, name TEXT);
+            CREATE TABLE aliases (name TEXT, key TEXT);
+            CREATE TABLE publications (key TEXT PRIMARY KEY, type TEXT,
+                                       title TEXT, year INTEGER,
+                                       authors TEXT, edited INTEGER);
+            CREATE TABLE authorships (name TEXT, pub TEXT, key TEXT);
+        """)
+        return store
+
+    def add_record(self, r):
+        if r['type'] == 'www':
+            # Person pages list the person's names, the first one is
+            # the main one and the others are aliases
+            if r['key'].startswith('homepages/') and r['author']:
+                key = r['author_keys'][0]
+                self.persons.append((key, r['author'][0]))
+                self.aliases.extend((name, key) for name in r['author'])
+        elif r['year'] is not None:
+            self.publications.append((r['key'], r['type'], r['title'],
+                                      r['year'], json.dumps(r['author']),
+                                      1 if r['editor'] else 0))
+            self.authorships.extend((name, r['key'], key) for name, key
+                                    in zip(r['author'], r['author_keys']))
+
+        if len(self.publications) + len(self.persons) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.db.executemany("INSERT OR IGNORE INTO persons VALUES (?, ?)",
+                            self.persons)
+        self.db.executemany("INSERT INTO aliases VALUES (?, ?)", self.aliases)
+        self.db.executemany("INSERT OR IGNORE INTO publications "
+                            "VALUES (?, ?, ?, ?, ?, ?)", self.publications)
+        self.db.executemany("INSERT INTO authorships VALUES (?, ?, ?)",
+                            self.authorships)
+        self.db.commit()
+        self.persons = []
+        self.aliases = []
+        self.publications = []
+        self.authorships = []
+
+    def finish(self):
+        """ Adds aliases for authors without a person page and indexes """
+        self.flush()
+        self.db.executescript("""
+            CREATE INDEX aliases_name ON aliases (name);
+            INSERT INTO aliases
+                SELECT DISTINCT name, key FROM authorships
+                WHERE name NOT IN (SELECT name FROM aliases);
+            CREATE INDEX aliases_name_nocase ON aliases (name COLLATE NOCASE);
+            CREATE INDEX aliases_key ON aliases (key);
+            CREATE INDEX authorships_name ON authorships (name);
+        """)
+        self.db.commit()
+
+    def author_keys(self, author):
+        """ Person keys of the persons named author, homonyms included """
+        name = ' '.join(author.replace('+', ' ').split())
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT key FROM aliases "
+                                   "WHERE name = ? COLLATE NOCASE OR "
+                                   "name LIKE ? ORDER BY key",
+                                   (name, name + ' 0%')).fetchall()
+        return [r[0] for r in rows]
+
+    def publication_keys(self, key):
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT authorships.pub "
+                                   "FROM aliases JOIN authorships "
+                                   "ON aliases.name = authorships.name "
+                                   "WHERE aliases.key = ? "
+                                   "ORDER BY authorships.pub",
+                                   (key,)).fetchall()
+        return [r[0] for r in rows]
+
+    def name_key(self, name):
+        with self.lock:
+            row = self.db.execute("SELECT key FROM aliases WHERE name = ?",
+                                  (name,)).fetchone()
+        return row[0] if row else person_key(name)
+
+    def publication_record(self, key):
+        """ Same record as dblp_crawler.publication_record, or None """
+        with self.lock:
+            row = self.db.execute("SELECT title, year, authors, edited "
+                                  "FROM publications WHERE key = ?",
+                                  (key,)).fetchone()
+        if not row:
+            return None
+        title, year, authors, edited = row
+        title = title.replace(',', ' ')
+        if edited:
+            return {'key': key, 'title': title, 'year': year, 'edited': True,
+                    'authors': [], 'author_keys': []}
+        authors = json.loads(authors)
+        return {'key': key, 'title': title, 'year': year, 'edited': False,
+                'authors': authors,
+                'author_keys': [self.name_key(a) for a in authors]}
+
+    def close(self):
+        self.db.close()
+
+
+def ingest(dump_path, db_path):
+    """ Builds the DumpStore at db_path from the (gzipped) dump """
+    store = DumpStore.create(db_path)
+    handler = DumpHandler(store)
+    parser = ET.XMLParser(target=handler)
+    # The dump uses the entities of dblp.dtd, which are the HTML ones
+    parser.entity.update({k: chr(v) for k, v
+                          in html.entities.name2codepoint.items()})
+
+    opener = gzip.open if dump_path.endswith('.gz') else open
+    with opener(dump_path, 'rb') as f:
+        with tqdm(unit='B', unit_scale=True) as progress:
+            chunk = f.read(CHUNK_SIZE)
+            while chunk:
+                parser.feed(chunk)
+                progress.update(len(chunk))
+                chunk = f.read(CHUNK_SIZE)
+    count = parser.close()
+
+    print("Indexing %d records" % count)
+    store.finish()
+    return store
@@ -0,0 +1,234 @@
+"""
+    Local web page to run the PC meeting: the current and next paper, who
+    has to leave the room and who can come back. The conflict matrix and
+    the discussion order are loaded once and kept in memory, and the order
+    can be changed (next, previous, skip, reorder) while the server runs.
+
+    Only uses the standard library (and the conflict matrix), and serves
+    on localhost, so it works offline.
+"""
+import argparse
+import html
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from conflict_matrix import ConflictMatrix
+from meeting_slides import discussion_order
+from util import iterate_csv
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>PC meeting</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+.leave {{ color: #b00; }} .back {{ color: #070; }}
+form {{ display: inline; }}
+ul {{ columns: 3; }}
+</style></head><body>
+<h1>Paper {current} ({position} of {total})</h1>
+<form method="post" action="/prev"><button>Previous</button></form>
+<form method="post" action="/next"><button>Next</button></form>
+<form method="post" action="/skip"><button>Skip (discuss last)</button></form>
+<h2>Out of the room ({n_out})</h2><ul>{out}</ul>
+<h2>Next: paper {next}</h2>
+<h3 class="leave">Leave ({n_leave})</h3><ul class="leave">{leave}</ul>
+<h3 class="back">Come back ({n_back})</h3><ul class="back">{back}</ul>
+<h2>Order</h2>
+<form method="post" action="/reorder">
+<input name="order" size="80" value="{order}"><button>Reorder</button>
+</form>
+</body></html>
+"""
+
+
+def read_names(pc_csv):
+    """ Names of the PC members of a HotCRP PC info csv, by email """
+    return {email: "%s %s" % (first, last)
+            for first, last, email in iterate_csv(pc_csv, encoding='utf-8',
+                                                  columns=[0, 1, 2])}
+
+
+def read_order(order_file):
+    """ pids, one per line """
+    with open(order_file) as f:
+        return [int(line) for line in f if line.strip()]
+
+
+class Meeting(object):
+    """
+    Discussion order and position of a PC meeting. The conflicts of each
+    paper are kept as sets of emails, so each view is a couple of set
+    operations.
+    """
+    def __init__(self, matrix, order, names=None):
+        self.conflicts = {pid: frozenset(matrix.emails_of(pid))
+                          for pid in matrix.pids}
+        self.names = names or {}
+        self.lock = threading.Lock()
+        self.order = []
+        self.position = 0
+        self.reorder(order)
+
+    def paper_conflicts(self, pid):
+        return self.conflicts.get(pid, frozenset())
+
+    def reorder(self, order):
+        """ New order of the papers, keeping the current paper """
+        order = [int(pid) for pid in order]
+        if len(set(order)) != len(order):
+            raise ValueError("Papers repeated in the order")
+        with self.lock:
+            current = (self.order[self.position]
+                       if self.position < len(self.order) else None)
+            self.order = order
+            self.position = (order.index(current) if current in order
+                             else 0)
+
+    def move(self, step):
+        with self.lock:
+            self.position = max(0, min(self.position + step,
+                                       len(self.order) - 1))
+
+    def skip(self):
+        """ Moves the current paper to the end of the order """
+        with self.lock:
+            if self.position < len(self.order) - 1:
+                self.order.append(self.order.pop(self.position))
+
+    def names_of(self, emails):
+        return sorted(self.names.get(e, e) for e in emails)
+
+    def state(self):
+        with self.lock:
+            order = list(self.order)
+            position = self.position
+        current = order[position] if order else None
+        nxt = order[position + 1] if position + 1 < len(order) else None
+        out = self.paper_conflicts(current)
+        out_next = self.paper_conflicts(nxt)
+        return {'current': current,
+                'next': nxt,
+                'position': position + 1,
+                'total': len(order),
+                'out': self.names_of(out),
+                'leave': self.names_of(out_next - out),
+                'back': self.names_of(out - out_next),
+                'order': order}
+
+
+class MeetingHandler(BaseHTTPRequestHandler):
+    meeting = None
+
+    def send(self, code, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_state(self, path):
+        state = self.meeting.state()
+        if path.startswith('/api'):
+            self.send(200, json.dumps(state), 'application/json')
+            return
+
+        def items(names):
+            return ''.join('<li>%s</li>' % html.escape(n) for n in names)
+        page = PAGE.format(
+            current=state['current'], next=state['next'] or '--',
+            position=state['position'], total=state['total'],
+            n_out=len(state['out']), out=items(state['out']),
+            n_leave=len(state['leave']), leave=items(state['leave']),
+            n_back=len(state['back']), back=items(state['back']),
+            order=','.join(str(pid) for pid in state['order']))
+        self.send(200, page, 'text/html; charset=utf-8')
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path in ('/', '/api/state'):
+            self.send_state(path)
+        else:
+            self.send(404, 'Not found\n', 'text/plain')
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        api = path.startswith('/api')
+        action = path[len('/api'):] if api else path
+        try:
+            if action == '/next':
+                self.meeting.move(1)
+            elif action == '/prev':
+                self.meeting.move(-1)
+            elif action == '/skip':
+                self.meeting.skip()
+            elif action == '/reorder':
+                if api:
+                    request = json.loads(body)
+                    if (not isinstance(request, dict) or
+                       not isinstance(request.get('order'), list)):
+                        raise ValueError("expected {\"order\": [pids]}")
+                    order = request['order']
+                else:
+                    order = parse_qs(body).get('order', [''])[0].split(',')
+                    order = [pid for pid in order if pid.strip()]
+                self.meeting.reorder(order)
+            else:
+                self.send(404, 'Not found\n', 'text/plain')
+                return
+        except (ValueError, KeyError, TypeError) as e:
+            self.send(400, 'Bad request: %s\n' % e, 'text/plain')
+            return
+
+        if api:
+            self.send_state('/api/state')
+        else:
+            self.send_response(303)
+            self.send_header('Location', '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("conflict_matrix",
+                        help="Conflict matrix saved by conflict_matrix.py")
+    parser.add_argument("--order",
+                        help="Discussion order, one pid per line. By "
+                        "default, the pids of the conflict matrix, which "
+                        "misses the papers without conflicts unless it was "
+                        "built with --submissions")
+    parser.add_argument("--optimize", action="store_true",
+                        help="Reorder the papers so the fewest PC members "
+                        "leave or enter the room")
+    parser.add_argument("--pc-csv",
+                        help="csv from hotcrp with the pc info, to show "
+                        "names instead of emails")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    matrix = ConflictMatrix.load(args.conflict_matrix)
+    order = read_order(args.order) if args.order else list(matrix.pids)
+    if args.optimize:
+        conflicts = [matrix.emails_of(pid) if pid in matrix.rows else []
+                     for pid in order]
+        order = [order[i] for i in discussion_order(conflicts)]
+    names = read_names(args.pc_csv) if args.pc_csv else None
+
+    MeetingHandler.meeting = Meeting(matrix, order, names)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), MeetingHandler)
+    print("Serving the meeting on http://127.0.0.1:%d/" % args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
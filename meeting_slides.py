@@ -1,14 +1,154 @@
+import hashlib
 import math
 
+# Longest run of papers that or_opt moves at once
+OR_OPT_SEGMENT = 3
 
-def print_conflicts(cs):
-    if cs:
-        str_out = ''
+
+def conflict_bitsets(conflicts):
+    """ One int per paper, with a bit set for each of its conflicts """
+    bit = {}
+    bitsets = []
+    for cs in conflicts:
+        b = 0
         for c in cs:
-            str_out += '%s\n\n' % c
-        return str_out
-    else:
-        return ''
+            b |= 1 << bit.setdefault(c, len(bit))
+        bitsets.append(b)
+    return bitsets
+
+
+def path_cost(order, dist, start):
+    """ Transitions along order, beginning at the start node """
+    return sum(dist[a][b] for a, b in zip([start] + order, order))
+
+
+def greedy_path(nodes, dist, start):
+    """ Nearest neighbour path over nodes, beginning at the start node """
+    left = list(nodes)
+    path = []
+    last = start
+    while left:
+        nxt = min(left, key=lambda n: dist[last][n])
+        left.remove(nxt)
+        path.append(nxt)
+        last = nxt
+    return path
+
+
+def two_opt(path, dist, start):
+    """ Reverses segments of path while that removes transitions """
+    p = [start] + path
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(p) - 1):
+            for j in range(i + 1, len(p)):
+                old = dist[p[i - 1]][p[i]]
+                new = dist[p[i - 1]][p[j]]
+                if j + 1 < len(p):
+                    old += dist[p[j]][p[j + 1]]
+                    new += dist[p[i]][p[j + 1]]
+                if new < old:
+                    p[i:j + 1] = p[i:j + 1][::-1]
+                    improved = True
+    return p[1:]
+
+
+def or_opt(path, dist, start):
+    """ Moves runs of up to OR_OPT_SEGMENT papers while that helps """
+    p = [start] + path
+    improved = True
+    while improved:
+        improved = False
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            for i in range(1, len(p) - length + 1):
+                j = i + length
+                seg = p[i:j]
+                # Cost of cutting the run out and closing the gap
+                gain = dist[p[i - 1]][seg[0]]
+                if j < len(p):
+                    gain += dist[seg[-1]][p[j]] - dist[p[i - 1]][p[j]]
+                rest = p[:i] + p[j:]
+                best = None
+                for k in range(len(rest)):
+                    if k == i - 1:
+                        continue
+                    nxt = rest[k + 1] if k + 1 < len(rest) else None
+                    for s in (seg, seg[::-1]):
+                        cost = dist[rest[k]][s[0]]
+                        if nxt is not None:
+                            cost += dist[s[-1]][nxt] - dist[rest[k]][nxt]
+                        if cost < gain and (best is None or cost < best[0]):
+                            best = (cost, k, s)
+                if best is not None:
+                    _, k, s = best
+                    p = rest[:k + 1] + s + rest[k + 1:]
+                    improved = True
+                    break
+            if improved:
+                break
+    return p[1:]
+
+
+def discussion_order(conflicts, groups=None):
+    """Reorders the papers so that as few PC members as possible leave or
+    enter the room between consecutive papers.
+    The number of PC members that leave or enter between two papers is
+    the Hamming distance of their conflict bitsets, and the order is an
+    open path over the papers: a nearest neighbour path improved with
+    2-opt and Or-opt moves.
+
+    Arguments:
+        conflicts {list[list[str]]} -- List with one list of conflict names
+            for each paper, as in gen_presentation.
+
+        groups {list} -- Optional group of each paper (e.g., 'discuss
+            first', 'tabled'). Groups are discussed in the order in which
+            they first appear, and papers are only reordered within their
+            group.
+
+    Returns:
+        [list[int]] -- Indices of the papers in discussion order.
+    """
+    if groups is None:
+        groups = [None] * len(conflicts)
+
+    bitsets = conflict_bitsets(conflicts)
+    # The meeting starts with everyone in the room
+    start = len(bitsets)
+    bitsets.append(0)
+    dist = [[bin(a ^ b).count('1') for b in bitsets] for a in bitsets]
+
+    by_group = {}
+    for idx, group in enumerate(groups):
+        by_group.setdefault(group, []).append(idx)
+
+    order = []
+    for nodes in by_group.values():
+        path = greedy_path(nodes, dist, start)
+        cost = path_cost(path, dist, start)
+        while True:
+            path = or_opt(two_opt(path, dist, start), dist, start)
+            new_cost = path_cost(path, dist, start)
+            if new_cost >= cost:
+                break
+            cost = new_cost
+        order += path
+        start = path[-1]
+    return order
+
+
+def count_transitions(conflicts, order=None):
+    """ PC members leaving or entering the room along order """
+    bitsets = conflict_bitsets(conflicts)
+    if order is None:
+        order = range(len(bitsets))
+    seq = [0] + [bitsets[i] for i in order]
+    return sum(bin(a ^ b).count('1') for a, b in zip(seq, seq[1:]))
+
+
+def print_conflicts(cs):
+    return ''.join('%s\n\n' % c for c in cs)
 
 
 def get_coi(tags):
@@ -22,6 +162,69 @@ def get_coi(tags):
         return 'PC Chair'
 
 
+PREAMBLE = ('\\documentclass[10pt,t,serif]{beamer}\n'
+            '\\newcommand\\Fontsmall{\\fontsize{7}{7}\\selectfont}\n'
+            '\\begin{document}\n')
+END = '\\end{document}\n'
+FRAME_TITLE = '\\begin{frame}[t]{Discussion order: %d}\n'
+
+
+def paper_columns(heading, chair, cs):
+    """ Chair and conflicts of a paper, with the conflicts in 4 columns """
+    out = ['\\begin{columns}[t]\n',
+           '\\column{.4\\textwidth}\n',
+           heading,
+           '\\textbf{Chair}: %s\n\n' % chair,
+           'Conflicts:\n\n',
+           '\\vspace{10pt}\n\n',
+           '\\column{.1\\textwidth}\n',
+           '\\column{.4\\textwidth}\n',
+           '\\column{.1\\textwidth}\n',
+           '\\end{columns}\n']
+
+    half = int(math.ceil(len(cs)/2))
+    quarter = int(math.ceil(half/2))
+
+    out.append('\\begin{columns}[t]\n')
+    for part in (cs[:quarter], cs[quarter:half], cs[half:half+quarter],
+                 cs[half+quarter:]):
+        out.append('\\column{.25\\textwidth}\n')
+        out.append(print_conflicts(part))
+    out.append('\\end{columns}\n')
+    return out
+
+
+def frame_content(c1, coi1, c2, coi2):
+    """ Frame of a paper, but for its title, which has its position """
+    out = paper_columns('Current paper \n\n', coi1, c1)
+    out.append('\\vspace{15pt}\n\\hrule\n\\vspace{15pt}\n')
+    out += paper_columns('\n\n Next paper\n\n', coi2, c2)
+    out.append('\\end{frame}\n')
+    return ''.join(out)
+
+
+def frame_keys(conflicts, tags):
+    """
+    (c1, coi1, c2, coi2) of each frame: the sorted conflicts and chair of
+    the current and next paper.
+    """
+    cs = zip(conflicts, conflicts[1:] + [[]])
+    tags = zip(tags, tags[1:] + [None])
+    for (c1, c2), (t1, t2) in zip(cs, tags):
+        yield (tuple(sorted(c1)), get_coi(t1),
+               tuple(sorted(c2)), get_coi(t2) if t2 is not None else '--')
+
+
+def frame_hash(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+def iter_frames(conflicts, tags):
+    """ Frames of gen_presentation, one at a time """
+    for i, (c1, coi1, c2, coi2) in enumerate(frame_keys(conflicts, tags), 1):
+        yield FRAME_TITLE % i + frame_content(list(c1), coi1, list(c2), coi2)
+
+
 def gen_presentation(conflicts, tags):
     """Generates a presentation that lists the conflicts for each
     paper, with the next conflict listed.
@@ -43,78 +246,54 @@ def gen_presentation(conflicts, tags):
         [str] -- str with the latex contents. This str can be dumped on a
             file and compiled with any latex compiler.
     """
-    str_out = '\\documentclass[10pt,t,serif]{beamer}\n'
-    str_out += '\\newcommand\\Fontsmall{\\fontsize{7}{7}\\selectfont}\n'
-    str_out += '\\begin{document}\n'
-
-    cs = [(i, j) for i, j in zip(conflicts, conflicts[1:] + [[]])]
-    tags = [(i, j) for i, j in zip(tags, tags[1:] + [None])]
-    for i, ((c1, c2), (t1, t2)) in enumerate(zip(cs, tags), 1):
-        str_out += '\\begin{frame}[t]{Discussion order: %d}\n' % i
-        # if len(c1) > 24 or len(c2) > 24:
-        # str_out += '\\Fontsmall\n'
-        c1 = sorted(c1)
-        c2 = sorted(c2)
-        coi1 = get_coi(t1)
-        coi2 = get_coi(t2)
-
-        str_out += '\\begin{columns}[t]\n'
-        str_out += '\\column{.4\\textwidth}\n'
-
-        str_out += 'Current paper \n\n'
-        str_out += '\\textbf{Chair}: %s\n\n' % coi1
-        str_out += 'Conflicts:\n\n'
-        str_out += '\\vspace{10pt}\n\n'
-        str_out += '\\column{.1\\textwidth}\n'
-        str_out += '\\column{.4\\textwidth}\n'
-        str_out += '\\column{.1\\textwidth}\n'
-        str_out += '\\end{columns}\n'
-
-        half = int(math.ceil(len(c1)/2))
-        quarter = int(math.ceil(half/2))
-
-        str_out += '\\begin{columns}[t]\n'
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c1[:quarter])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c1[quarter:half])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c1[half:half+quarter])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c1[half+quarter:])
-        str_out += '\\end{columns}\n'
-        str_out += '\\vspace{15pt}\n\\hrule\n\\vspace{15pt}\n'
-
-        str_out += '\\begin{columns}[t]\n'
-        str_out += '\\column{.4\\textwidth}\n'
-
-        str_out += '\n\n Next paper\n\n'
-        if t2 is not None:
-            str_out += '\\textbf{Chair}: %s\n\n' % coi2
-        else:
-            str_out += '\\textbf{Chair}: --\n\n'
-        str_out += 'Conflicts:\n\n'
-        str_out += '\\vspace{10pt}\n\n'
-        str_out += '\\column{.1\\textwidth}\n'
-        str_out += '\\column{.4\\textwidth}\n'
-        str_out += '\\column{.1\\textwidth}\n'
-        str_out += '\\end{columns}\n'
-
-        half = int(math.ceil(len(c2)/2))
-        quarter = int(math.ceil(half/2))
-
-        str_out += '\\begin{columns}[t]\n'
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c2[:quarter])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c2[quarter:half])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c2[half:half+quarter])
-        str_out += '\\column{.25\\textwidth}\n'
-        str_out += print_conflicts(c2[half+quarter:])
-        str_out += '\\end{columns}\n'
-
-        str_out += '\\end{frame}\n'
-
-    str_out += '\\end{document}\n'
-    return str_out
+    return PREAMBLE + ''.join(iter_frames(conflicts, tags)) + END
+
+
+def write_presentation(tex_file, conflicts, tags):
+    """ Streams the frames of gen_presentation to tex_file """
+    with open(tex_file, 'w') as f:
+        f.write(PREAMBLE)
+        for frame in iter_frames(conflicts, tags):
+            f.write(frame)
+        f.write(END)
+
+
+class SlideDeck(object):
+    """
+    Frames by the hash of their content (current and next paper), so when
+    the order changes during the meeting, only the frames whose current
+    or next paper changed are generated again. Only the frames of the
+    last order are kept.
+    """
+    def __init__(self):
+        self.frames = {}
+        self.hashes = []
+        self.changed = []
+
+    def iter_frames(self, conflicts, tags):
+        hashes = []
+        for i, key in enumerate(frame_keys(conflicts, tags), 1):
+            h = frame_hash(key)
+            hashes.append(h)
+            if h not in self.frames:
+                c1, coi1, c2, coi2 = key
+                self.frames[h] = frame_content(list(c1), coi1, list(c2),
+                                               coi2)
+            yield FRAME_TITLE % i + self.frames[h]
+        self.changed = [i for i, h in enumerate(hashes, 1)
+                        if i > len(self.hashes) or self.hashes[i - 1] != h]
+        self.hashes = hashes
+        self.frames = {h: self.frames[h] for h in hashes}
+
+    def write(self, tex_file, conflicts, tags):
+        """
+        Streams the whole presentation to tex_file, the cache only saves
+        generating the frames. Returns the frames (numbered from 1) that
+        differ from the previous write.
+        """
+        with open(tex_file, 'w') as f:
+            f.write(PREAMBLE)
+            for frame in self.iter_frames(conflicts, tags):
+                f.write(frame)
+            f.write(END)
+        return self.changed
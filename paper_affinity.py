@@ -9,11 +9,11 @@
 import argparse
 import re
 import csv
+import numpy as np
 from util import (iterate_csv, get_dict_json)
-from tqdm import tqdm
+from citation_extractor import extract_citations, CACHE_PATH
 from os import listdir
 from os.path import join
-from subprocess import Popen, PIPE
 
 
 def get_citation_count(submission_csv, citation_dict):
@@ -62,51 +62,66 @@ def read_expertise_to_topics(topics_to_expertise_csv):
     return e_to_t, t_to_e, exp_list, topic_list
 
 
-def write_dict_of_lists(filename, toWrite, schema):
-    with open(filename, 'w') as fh:
-        writer = csv.DictWriter(fh, fieldnames=schema)
-        writer.writeheader()
-        for k, v in toWrite.items():
-            if v is not None:
-                writer.writerow(v)
+def index_of(names):
+    return {n: i for i, n in enumerate(names)}
 
 
-def pdf_to_text(filename):
-    process = Popen(["pdftotext", filename], stdout=PIPE)
-    (output, err) = process.communicate()
-    exit_code = process.wait()
-    if exit_code:
-        print("WARNING: couldn't parse %s" % filename)
+def expertise_scores(sub_topics, pids, t_to_e, expertise_db, emails):
+    """
+    pids x emails matrix with, for each paper and PC member, the number of
+    (paper topic, expertise mapped to the topic) pairs where the PC member
+    has the expertise. Computed as papers x topics . topics x expertises .
+    expertises x PC members, with repeated topics and mappings counted as
+    many times as they appear.
+    """
+    topics = index_of(sorted(t_to_e))
+    expertises = index_of(sorted(set(e for es in t_to_e.values()
+                                     for e in es)))
 
+    paper_topics = np.zeros((len(pids), len(topics)), dtype=np.int64)
+    for row, pid in enumerate(pids):
+        for topic in sub_topics[pid]:
+            paper_topics[row, topics[topic]] += 1
 
-def match_author(rolling_word_list, pc_members):
-    pass
+    topic_exps = np.zeros((len(topics), len(expertises)), dtype=np.int64)
+    for topic, es in t_to_e.items():
+        for e in es:
+            topic_exps[topics[topic], expertises[e]] += 1
 
+    pc_exps = np.zeros((len(emails), len(expertises)), dtype=np.int64)
+    for col, email in enumerate(emails):
+        for e in expertise_db[email]['expertises']:
+            if e in expertises:
+                pc_exps[col, expertises[e]] = 1
 
-def parse_txt(filename, pc_members):
-    txt = ""
-    pc_matches = {pc: 0 for pc in pc_members}
-    ackset = False
-    parsing_references = False
-    rolling_word_list = ['', '', '']
-    with open(filename, 'r') as f:
-        txt = f.read()
+    return paper_topics.dot(topic_exps).dot(pc_exps.T)
 
-    if not txt:
-        return None
 
-    words = txt.split()
-    for w in words:
-        if parsing_references:
-            rolling_word_list = rolling_word_list[1:] + [w]
-            match_author(rolling_word_list, pc_matches, pc_members)
+def citation_scores(citations, pids, emails):
+    """
+    pids x emails matrix of citation counts, scattered from the (sparse)
+    per paper citation dicts.
+    """
+    rows = index_of(pids)
+    cols = index_of(emails)
+    coords = [(rows[pid], cols[email], count)
+              for pid, counts in citations.items() if pid in rows
+              for email, count in counts.items() if email in cols]
 
-        if w.lower == 'references':
-            parsing_references = True
-        elif w.lower == 'acknowledgement':
-            ackset = True
+    scores = np.zeros((len(pids), len(emails)), dtype=np.int64)
+    if coords:
+        r, c, v = zip(*coords)
+        scores[list(r), list(c)] = v
+    return scores
 
-        print(w)
+
+def write_dict_of_lists(filename, toWrite, schema):
+    with open(filename, 'w') as fh:
+        writer = csv.DictWriter(fh, fieldnames=schema)
+        writer.writeheader()
+        for k, v in toWrite.items():
+            if v is not None:
+                writer.writerow(v)
 
 
 def main():
@@ -122,6 +137,11 @@ def main():
                         "to the topics used in HotCRP")
     parser.add_argument("--submissions",
                         help="Folder where the submissions are")
+    parser.add_argument("--extract-citations", action="store_true",
+                        help="Count the citations of the submission pdfs "
+                        "to the --pc-csv members first")
+    parser.add_argument("--citation-cache", default=CACHE_PATH,
+                        help="Cache of extracted texts and citation counts")
     parser.add_argument("--out-pc-topics",
                         help="PC topics reports")
     parser.add_argument("--out-pc-citations",
@@ -139,6 +159,13 @@ def main():
 
     submissionList = get_dict_json(args.paper_json)
 
+    if args.extract_citations:
+        failed = extract_citations(args.pc_csv, args.submissions,
+                                   cache_path=args.citation_cache)
+        if failed:
+            print("Couldn't extract the text of papers: %s" %
+                  ", ".join(str(pid) for pid in failed))
+
     allFiles = listdir(args.submissions)
     justcsvs = list(filter(lambda x: x.endswith(".csv"), allFiles))
     refCounts = list(map(lambda x: join(args.submissions, x), justcsvs))
@@ -147,39 +174,19 @@ def main():
     for ref in refCounts:
         get_citation_count(ref, citationsList)
 
-    sub_prefs_exp = {}
-    sub_prefs_cit = {}
     sub_topics = {}
-    for submission in tqdm(submissionList):
-        pid = submission['pid']
-        paper_topics = (submission['topics']
-                        if 'topics' in submission else [])
-        sub_topics[pid] = (submission['topics']
-                           if 'topics' in submission else [])
-
-        pc_citations = (citationsList[pid]
-                        if pid in citationsList else {})
-
-        sub_prefs_exp[pid] = {}
-        sub_prefs_cit[pid] = {}
-        for email, rev in expertise_db.items():
-            score_expertise = 0
-            score_citation = 0
-
-            exps = rev['expertises']
-            if email in pc_citations:
-                score_citation = pc_citations[email]
-
-            for topic in paper_topics:
-                for x in t_to_e[topic]:
-                    if x in exps:
-                        score_expertise += 1
-
-            sub_prefs_exp[pid][email] = score_expertise
-            sub_prefs_cit[pid][email] = score_citation
+    for submission in submissionList:
+        sub_topics[submission['pid']] = (submission['topics']
+                                         if 'topics' in submission else [])
 
     emails = sorted([k for k, v in expertise_db.items()])
     pids = sorted([int(s['pid']) for s in submissionList])
+    # One matrix row per paper, even if the json repeats it
+    rows = index_of(sorted(set(pids)))
+
+    sub_prefs_exp = expertise_scores(sub_topics, list(rows), t_to_e,
+                                     expertise_db, emails)
+    sub_prefs_cit = citation_scores(citationsList, list(rows), emails)
 
     headers = 'pid,topics,' + ','.join(emails) + ',total' + '\n'
 
@@ -188,9 +195,10 @@ def main():
             f.write(headers)
             for pid in pids:
                 topics = (';'.join(sub_topics[pid])).replace(',', '-')
+                row = scores[rows[pid]].tolist()
                 s = '%d,%s,' % (pid, topics)
-                s += ','.join([str(scores[pid][e]) for e in emails])
-                s += ',%d\n' % sum([scores[pid][e] for e in emails])
+                s += ','.join([str(score) for score in row])
+                s += ',%d\n' % sum(row)
 
                 f.write(s)
 
@@ -199,14 +207,13 @@ def main():
 
     # Print csv for hotcrp upload
     schema = "paper,email,assignment,preference\n"
+    affinity = sub_prefs_exp + sub_prefs_cit
     with open(hotcrp_csv, 'w') as f:
         f.write(schema)
         for pid in pids:
-            for email in emails:
-                score = sub_prefs_exp[pid][email] + sub_prefs_cit[pid][email]
+            for email, score in zip(emails, affinity[rows[pid]].tolist()):
                 s = "%s,%s,preference,%d\n" % (pid, email, score)
                 f.write(s)
 
-
 if __name__ == '__main__':
     main()
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 from tqdm import tqdm
-from util import iterate_csv, get_dict_json, save_dict_json
-from dblp_crawler import (request_publication, sanitize_titles,
-                          sanitize_coauthors, save_cache)
+from util import (iterate_csv, iterate_json_list, get_dict_json,
+                  save_dict_json)
+from dblp_crawler import request_publication_record, publication_record
 from base import Person, Institutions
 from conflict import BaseConflicts
 from copy import deepcopy
@@ -10,6 +10,8 @@ from functools import reduce
 
 
 class Publication(object):
+    __slots__ = ('valid', 'key', 'title', 'insts', 'authors', 'year')
+
     def __init__(self, key, title, authors, year, institutions, valid=True):
         self.valid = valid
         self.key = key
@@ -19,13 +21,15 @@ class Publication(object):
         for author in authors:
             name, a_key = author
             self.authors.add_co_author(Person(name, a_key, key))
+        # Authors are only iterated once the publication is built
+        self.authors.collabs.drop_index()
         self.year = year
 
     @classmethod
     def from_key(cls, key, institutions):
-        xml, rdf = request_publication(key)
-        if xml:
-            return cls.from_xml(xml, rdf, institutions)
+        record = request_publication_record(key)
+        if record:
+            return cls.from_record(record, institutions)
         else:
             return None
 
@@ -34,48 +38,21 @@ class Publication(object):
         return cls(key, title, [], year, institutions, False)
 
     @classmethod
-    def from_xml(cls, xml, rdf, institutions):
-        pub_type = list(xml['dblp'].keys())[0]
-        key = xml['dblp'][pub_type]['@key']
-        year = int(xml['dblp'][pub_type]['year'])
-        title = sanitize_titles(xml['dblp'][pub_type]['title'])
-
-        if 'dblp:editedBy' in rdf['rdf:RDF']['dblp:Publication'][1]:
-            return cls.invalid_pub(title, key, year, institutions)
-
-        if rdf:
-            # Scrap authors from rdf file
-            try:
-                authors_list = rdf['rdf:RDF']['dblp:Publication'][1]['dblp:authoredBy']
-                if isinstance(authors_list, list):
-                    author_keys = [i['@rdf:resource'][21:]
-                                   for i in authors_list
-                                   if i['@rdf:resource'].startswith('http://dblp.org/pers/')]
-                else:
-                    author_keys = (authors_list['@rdf:resource'][21:]
-                                   if authors_list['@rdf:resource'].startswith('http://dblp.org/pers/')
-                                   else [])
-            except Exception as ex:
-                print("Bad rdf:")
-                print(rdf['rdf:RDF']['dblp:Publication'][1])
-                raise ex
-
-        if 'author' in xml['dblp'][pub_type]:
-            authors = sanitize_coauthors(xml['dblp'][pub_type]['author'])
-        else:
-            authors = []
-
-        if len(author_keys) == len(authors):
-            authors = zip(authors, author_keys)
-        else:
-            authors = [(a, None) for a in authors]
-
-        return cls(key,
-                   title,
-                   authors,
-                   year,
+    def from_record(cls, record, institutions):
+        if record['edited']:
+            return cls.invalid_pub(record['title'], record['key'],
+                                   record['year'], institutions)
+
+        return cls(record['key'],
+                   record['title'],
+                   zip(record['authors'], record['author_keys']),
+                   record['year'],
                    institutions)
 
+    @classmethod
+    def from_xml(cls, xml, rdf, institutions):
+        return cls.from_record(publication_record(xml, rdf), institutions)
+
     def get_authors(self):
         return self.authors
 
@@ -93,6 +70,72 @@ class Publication(object):
         return "Title: %s, key:%s" % (self.title, self.key)
 
 
+class PublicationRegistry(object):
+    """
+    Publications by DBLP key. Each publication is built once and shared by
+    all the PC members that authored it.
+    """
+    def __init__(self, institutions):
+        self.insts = institutions
+        self.pubs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key in self.pubs:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.pubs[key] = Publication.from_key(key, self.insts)
+        return self.pubs[key]
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return ("%d publications, %d hits, %d misses (%.1f%% hit rate)" %
+                (len(self.pubs), self.hits, self.misses,
+                 100 * self.hit_rate()))
+
+
+class PairConflicts(object):
+    """
+    Conflicts between a submission and the HotCRP and DBLP records of a PC
+    member. Each source is intersected with the submission at most once,
+    and only if some conflict category needs it.
+    """
+    def __init__(self, submission, pc_member_hotcrp, pc_member_dblp):
+        self.submission = submission
+        self.pc_member_hotcrp = pc_member_hotcrp
+        self.pc_member_dblp = pc_member_dblp
+        self._hotcrp = None
+        self._dblp = None
+
+    def hotcrp(self):
+        if self._hotcrp is None:
+            self._hotcrp = self.match_hotcrp()
+        return self._hotcrp
+
+    def dblp(self):
+        if self._dblp is None:
+            self._dblp = self.match_dblp()
+        return self._dblp
+
+    def match_hotcrp(self):
+        return self.submission.get_conflicts_from_pc_member(
+            self.pc_member_hotcrp, False)
+
+    def match_dblp(self):
+        return self.submission.get_conflicts_from_pc_member(
+            self.pc_member_dblp, False)
+
+
+# Fields of the HotCRP export that Submission.from_json reads
+SUBMISSION_FIELDS = ['pid', 'title', 'authors', 'pc_conflicts',
+                     'collaborators']
+
+
 class Submission(Publication):
     def __init__(self, pid, title, authors, affiliations,
                  institutions, pc_conflicts, collaborators):
@@ -139,6 +182,12 @@ class Submission(Publication):
         return cls(json_dic['pid'], json_dic['title'], authors, affiliations,
                    institutions, pc_conflicts, collaborators)
 
+    @classmethod
+    def iterate_json(cls, json_file, institutions):
+        """ Submissions of a HotCRP JSON export, read one at a time """
+        for json_dic in iterate_json_list(json_file, SUBMISSION_FIELDS):
+            yield cls.from_json(json_dic, institutions)
+
     def add_collaborator_conflict(self, pc_member):
         if pc_member.email in self.declared_pc:
             return
@@ -205,6 +254,38 @@ class Submission(Publication):
             else:
                 raise ValueError("What is going on pal?")
 
+    def get_conflict_lists(self):
+        return (self.collabs_field_cs, self.pc_member_collabs_field_cs,
+                self.dblp_cs, self.fake_conflicts)
+
+    def set_conflict_lists(self, lists):
+        (self.collabs_field_cs, self.pc_member_collabs_field_cs,
+         self.dblp_cs, self.fake_conflicts) = lists
+
+    def clear_conflict_lists(self):
+        self.set_conflict_lists(({}, {}, {}, {}))
+
+    def add_pc_member_conflicts(self, pc_member_hotcrp, pc_member_dblp):
+        """
+        Same as add_collaborator_conflict, add_conflicts_from_pc_member,
+        add_conflicts_from_dblp and add_fake_conflicts, in one pass over
+        the pair.
+        """
+        self.add_collaborator_conflict(pc_member_hotcrp)
+
+        email = pc_member_hotcrp.email
+        pair = PairConflicts(self, pc_member_hotcrp, pc_member_dblp)
+        if not (email in self.declared_pc or email in self.collabs_field_cs):
+            if pair.hotcrp():
+                self.pc_member_collabs_field_cs[email] = pair.hotcrp()
+            elif pair.dblp():
+                self.dblp_cs[email] = pair.dblp()
+        elif not (pair.hotcrp() or pair.dblp()):
+            if email in self.declared_pc:
+                self.fake_conflicts[email] = "pc_conflicts"
+            else:
+                self.fake_conflicts[email] = "collaborators"
+
     def list_conflicts(self, conflict_type):
         if conflict_type == 'proper':
             return {e: "" for e in self.declared_pc}
@@ -219,16 +300,12 @@ class Submission(Publication):
         else:
             raise ValueError("don't know how to geneate this list")
 
-    def conflicts_csv(self, conflict_type):
-        l = self.list_conflicts(conflict_type)
-        s = []
-        for email, reasons in l.items():
+    def conflict_rows(self, conflict_type):
+        """ [valid, pid, email, reasons] rows of a conflict report """
+        for email, reasons in self.list_conflicts(conflict_type).items():
             if isinstance(reasons, BaseConflicts):
-                str_reasons = reasons.str_no_linebreaks()
-            else:
-                str_reasons = reasons
-            s.append("x, %d, %s, %s" % (self.pid, email, str_reasons))
-        return s
+                reasons = reasons.str_no_linebreaks()
+            yield ['x', self.pid, email, reasons]
 
 
 class PCMember(Person):
@@ -0,0 +1,184 @@
+"""
+    Opt-in instrumentation of the COI scripts: wall time per stage, time
+    spent in selected functions, fuzz.token_sort_ratio calls by call site
+    and the slowest submissions.
+
+    Nothing is measured until enable() is called, and stage() and
+    submission() are no-ops until then.
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from fuzzywuzzy import fuzz
+
+SLOWEST_SUBMISSIONS = 20
+
+# The active Profile, see enable
+profile = None
+
+
+def call_site(frame):
+    code = frame.f_code
+    return "%s:%s" % (os.path.basename(code.co_filename),
+                      getattr(code, 'co_qualname', code.co_name))
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return {'hits': hits, 'misses': misses,
+            'hit_rate': hits / total if total else 0.0}
+
+
+class Profile(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = []
+        self.accumulated = {}
+        self.reset()
+
+    def reset(self):
+        """ Clears the counters, e.g., in a freshly forked worker """
+        self.fuzzy_calls = Counter()
+        self.function_calls = Counter()
+        self.function_seconds = Counter()
+        self.submissions = []
+
+    @contextmanager
+    def stage(self, name):
+        calls = sum(self.fuzzy_calls.values())
+        start = time.perf_counter()
+        yield
+        self.stages.append({'stage': name,
+                            'seconds': time.perf_counter() - start,
+                            'fuzzy_calls': (sum(self.fuzzy_calls.values()) -
+                                            calls)})
+
+    @contextmanager
+    def accumulate(self, name):
+        """
+        Same as stage, for work interleaved with other stages: the time
+        of every entry is added to one stage.
+        """
+        entry = self.accumulated.get(name)
+        if entry is None:
+            entry = self.accumulated[name] = {'stage': name, 'seconds': 0.0,
+                                              'fuzzy_calls': 0}
+            self.stages.append(entry)
+        calls = sum(self.fuzzy_calls.values())
+        start = time.perf_counter()
+        yield
+        entry['seconds'] += time.perf_counter() - start
+        entry['fuzzy_calls'] += sum(self.fuzzy_calls.values()) - calls
+
+    @contextmanager
+    def submission(self, pid):
+        start = time.perf_counter()
+        yield
+        self.submissions.append((time.perf_counter() - start, pid))
+
+    def count_fuzzy_calls(self):
+        """
+        Counts fuzz.token_sort_ratio calls by the function that made them
+        and its caller.
+        """
+        token_sort_ratio = fuzz.token_sort_ratio
+
+        @wraps(token_sort_ratio)
+        def counted(*args, **kwargs):
+            caller = sys._getframe(1)
+            site = call_site(caller)
+            if caller.f_back is not None:
+                site += " <- " + call_site(caller.f_back)
+            self.fuzzy_calls[site] += 1
+            return token_sort_ratio(*args, **kwargs)
+        fuzz.token_sort_ratio = counted
+
+    def time_function(self, owner, name, label=None):
+        """ Accumulates the time spent in owner.name (inclusive) """
+        func = getattr(owner, name)
+        label = label or name
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.function_calls[label] += 1
+                self.function_seconds[label] += time.perf_counter() - start
+        setattr(owner, name, timed)
+
+    def take_counts(self):
+        """ Counters measured since the last reset, which are cleared """
+        counts = (self.fuzzy_calls, self.function_calls,
+                  self.function_seconds, self.submissions)
+        self.reset()
+        return counts
+
+    def merge_counts(self, counts):
+        """ Adds the counters taken by a worker process """
+        fuzzy_calls, function_calls, function_seconds, submissions = counts
+        self.fuzzy_calls.update(fuzzy_calls)
+        self.function_calls.update(function_calls)
+        self.function_seconds.update(function_seconds)
+        self.submissions.extend(submissions)
+
+    def summary(self, caches=None):
+        slowest = sorted(self.submissions, reverse=True)[:SLOWEST_SUBMISSIONS]
+        return {
+            'total_seconds': time.perf_counter() - self.start,
+            'stages': self.stages,
+            'functions': {label: {'calls': self.function_calls[label],
+                                  'seconds': self.function_seconds[label]}
+                          for label in sorted(self.function_seconds)},
+            'fuzzy_calls': {
+                'total': sum(self.fuzzy_calls.values()),
+                'by_call_site': dict(self.fuzzy_calls.most_common())},
+            'caches': {name: hit_rate(hits, misses)
+                       for name, (hits, misses) in (caches or {}).items()},
+            'slowest_submissions': [{'pid': pid, 'seconds': seconds}
+                                    for seconds, pid in slowest]}
+
+    def save(self, path, caches=None):
+        with open(path, 'w') as f:
+            json.dump(self.summary(caches), f, indent=2)
+
+
+def enable():
+    """ Starts profiling, or returns the active profile """
+    global profile
+    if profile is None:
+        profile = Profile()
+        profile.count_fuzzy_calls()
+    return profile
+
+
+def stage(name):
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def accumulate(name):
+    return profile.accumulate(name) if profile is not None else nullcontext()
+
+
+def iterate(name, iterable):
+    """ Items of iterable, adding the time to produce them to stage name """
+    if profile is None:
+        yield from iterable
+        return
+    it = iter(iterable)
+    while True:
+        with profile.accumulate(name):
+            item = next(it, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def submission(pid):
+    return (profile.submission(pid) if profile is not None
+            else nullcontext())
@@ -0,0 +1,309 @@
+"""
+    Assigns reviewers to papers, maximizing the total affinity computed by
+    paper_affinity.py, such that each paper gets the same number of
+    reviewers, no reviewer gets more papers than their load cap, and no
+    paper goes to a reviewer with a valid conflict in the cross-reference
+    reports.
+
+    The assignment is a min-cost flow (source -> papers -> reviewers ->
+    sink), solved with successive shortest paths. Each shortest path is a
+    Dijkstra over the reviewers only: a path leaves a reviewer through one
+    of the papers assigned to it, so relaxing a reviewer takes one numpy
+    operation over its papers, and the papers stay implicit. Between
+    Dijkstras, the paths that are already shortest (zero reduced cost) are
+    augmented directly, so most reviewers are assigned without one.
+
+    Costs, assignments and conflicts are dense papers x reviewers arrays,
+    not sparse edge lists: every paper can go to almost every reviewer, so
+    the dense rows are what the numpy relaxations work on. Memory grows
+    with papers x reviewers, about 40 bytes per pair at peak (inputs
+    included), e.g. 60 MB for 3000 papers and 500 reviewers.
+"""
+import argparse
+import numpy as np
+from math import ceil
+from util import iterate_csv
+from conflict_matrix import ConflictMatrix
+
+ASSIGNMENT_HEADER = "paper,assignment,email\n"
+
+
+def read_affinity(affinity_csv):
+    """ pids, emails and pids x emails affinity of a paper_affinity csv """
+    scores = {}
+    for paper, email, _, preference in iterate_csv(affinity_csv):
+        scores[int(paper), email.strip()] = int(preference)
+
+    pids = sorted(set(pid for pid, _ in scores))
+    emails = sorted(set(email for _, email in scores))
+    rows = {pid: i for i, pid in enumerate(pids)}
+    cols = {email: i for i, email in enumerate(emails)}
+    affinity = np.zeros((len(pids), len(emails)), dtype=np.int64)
+    for (pid, email), score in scores.items():
+        affinity[rows[pid], cols[email]] = score
+    return pids, emails, affinity
+
+
+class Assignment(object):
+    """
+    Successive shortest paths over papers and reviewers. Costs are kept
+    non-negative by node potentials, so every shortest path is a Dijkstra
+    on reduced costs.
+    """
+    def __init__(self, affinity, conflicts, per_paper, loads):
+        n_papers, n_reviewers = affinity.shape
+        # Every complete assignment has n_papers * per_paper pairs, so
+        # shifting the costs to be non-negative keeps the optimum
+        self.cost = (affinity.max(initial=0) - affinity).astype(np.float64)
+        self.cost[conflicts] = np.inf
+        self.per_paper = per_paper
+        self.loads = np.asarray(loads, dtype=np.int64)
+        self.assigned = np.zeros((n_papers, n_reviewers), dtype=bool)
+        self.papers_of = [[] for _ in range(n_reviewers)]
+        self.n_reviewers = np.zeros(n_papers, dtype=np.int64)
+        self.pi_paper = np.zeros(n_papers)
+        self.pi_reviewer = np.zeros(n_reviewers)
+        self.pi_sink = 0.0
+
+    def reduced(self, rows):
+        """ Reduced costs of the forward paper -> reviewer edges of rows """
+        rc = (self.cost[rows] + self.pi_paper[rows, None] -
+              self.pi_reviewer[None, :])
+        rc[self.assigned[rows]] = np.inf
+        return rc
+
+    def shortest_path(self):
+        """
+        Dijkstra from the papers that need reviewers to the reviewers with
+        spare load. Returns the sink distance, reviewer distances, the
+        scanned reviewers and, for each reviewer, the paper it was reached
+        through and the reviewer that paper was reached from (-1 if it was
+        reached from the source).
+        """
+        n_reviewers = len(self.loads)
+        needy = np.flatnonzero(self.n_reviewers < self.per_paper)
+        dist = np.full(n_reviewers, np.inf)
+        via_paper = np.full(n_reviewers, -1, dtype=np.int64)
+        from_reviewer = np.full(n_reviewers, -1, dtype=np.int64)
+        scanned = np.zeros(n_reviewers, dtype=bool)
+        sink = np.inf
+        if not len(needy):
+            return sink, dist, scanned, via_paper, from_reviewer
+
+        reduced = self.reduced(slice(None))
+        rc = reduced[needy] - self.pi_paper[needy, None]
+        best = rc.argmin(axis=0)
+        dist[:] = rc[best, np.arange(n_reviewers)]
+        via_paper[:] = needy[best]
+
+        spare = self.loads > np.array([len(ps) for ps in self.papers_of])
+        sink_rc = self.pi_reviewer - self.pi_sink
+        pending = dist.copy()
+        while True:
+            r = int(pending.argmin())
+            d = pending[r]
+            if d >= sink:
+                break
+            scanned[r] = True
+            pending[r] = np.inf
+            if spare[r]:
+                sink = min(sink, d + sink_rc[r])
+            papers = self.papers_of[r]
+            if not papers:
+                continue
+
+            # r -> paper (reverse edge) -> other reviewers
+            papers = np.array(papers)
+            back = -(self.cost[papers, r] + self.pi_paper[papers] -
+                     self.pi_reviewer[r])
+            rc = reduced[papers] + (d + back)[:, None]
+            best = rc.argmin(axis=0)
+            new = rc[best, np.arange(n_reviewers)]
+            better = (new < dist) & ~scanned
+            dist[better] = new[better]
+            pending[better] = new[better]
+            via_paper[better] = papers[best[better]]
+            from_reviewer[better] = r
+
+        return sink, dist, scanned, via_paper, from_reviewer
+
+    def paper_distances(self, dist, scanned):
+        """ Distances of the papers, from the scanned reviewers """
+        d = np.full(len(self.pi_paper), np.inf)
+        needy = self.n_reviewers < self.per_paper
+        d[needy] = -self.pi_paper[needy]
+        for r in np.flatnonzero(scanned):
+            papers = np.array(self.papers_of[r], dtype=np.int64)
+            if not len(papers):
+                continue
+            back = -(self.cost[papers, r] + self.pi_paper[papers] -
+                     self.pi_reviewer[r])
+            d[papers] = np.minimum(d[papers], dist[r] + back)
+        return d
+
+    def apply(self, path):
+        """
+        Augments along path, the [(paper, reviewer)] edges that it adds:
+        each paper after the first leaves the reviewer before it.
+        """
+        prev = None
+        for p, r in path:
+            self.assigned[p, r] = True
+            self.papers_of[r].append(p)
+            if prev is not None:
+                self.assigned[p, prev] = False
+                self.papers_of[prev].remove(p)
+            prev = r
+        self.n_reviewers[path[0][0]] += 1
+
+    def augment(self, sink, dist, scanned, via_paper, from_reviewer):
+        spare = self.loads > np.array([len(ps) for ps in self.papers_of])
+        candidates = np.flatnonzero(scanned & spare)
+        end = dist[candidates] + self.pi_reviewer[candidates] - self.pi_sink
+        r = int(candidates[end.argmin()])
+
+        paper_dist = self.paper_distances(dist, scanned)
+        self.pi_reviewer += np.minimum(dist, sink)
+        self.pi_paper += np.minimum(paper_dist, sink)
+        self.pi_sink += sink
+
+        path = []
+        while r >= 0:
+            path.append((int(via_paper[r]), r))
+            r = int(from_reviewer[r])
+        self.apply(path[::-1])
+
+    def augment_admissible(self):
+        """
+        Augments paths of zero reduced cost, which are all shortest paths,
+        without a Dijkstra. Each reviewer is visited once, so these are
+        some, not all, of the shortest paths.
+        """
+        reduced = self.cost + self.pi_paper[:, None] - self.pi_reviewer
+        forward = (reduced == 0) & ~self.assigned
+        backward = (reduced == 0) & self.assigned
+        loads = np.array([len(ps) for ps in self.papers_of])
+        open_reviewer = ((loads < self.loads) &
+                         (self.pi_reviewer == self.pi_sink))
+        visited = np.zeros(len(self.loads), dtype=bool)
+
+        def steps(p):
+            for r in np.flatnonzero(forward[p] & ~visited):
+                yield p, r
+
+        def back_steps(r):
+            for p in list(self.papers_of[r]):
+                if backward[p, r]:
+                    yield from steps(p)
+
+        def find_path(p):
+            path = []
+            stack = [steps(p)]
+            while stack:
+                step = next(stack[-1], None)
+                if step is None:
+                    stack.pop()
+                    if path:
+                        path.pop()
+                    continue
+                q, r = step
+                if visited[r]:
+                    continue
+                visited[r] = True
+                path.append((q, r))
+                if open_reviewer[r]:
+                    return path
+                stack.append(back_steps(r))
+            return None
+
+        needy = np.flatnonzero((self.n_reviewers < self.per_paper) &
+                               (self.pi_paper == 0))
+        for p in needy:
+            while (self.n_reviewers[p] < self.per_paper and
+                   open_reviewer.any()):
+                path = find_path(p)
+                if path is None:
+                    break
+                self.apply(path)
+                prev = None
+                for q, r in path:
+                    forward[q, r] = False
+                    backward[q, r] = True
+                    if prev is not None:
+                        forward[q, prev] = True
+                        backward[q, prev] = False
+                    prev = r
+                loads[r] += 1
+                open_reviewer[r] = loads[r] < self.loads[r]
+
+    def solve(self):
+        """ Assigns as many reviewers as possible, at the least cost """
+        while True:
+            self.augment_admissible()
+            path = self.shortest_path()
+            if path[0] == np.inf:
+                return self.assigned
+            self.augment(*path)
+
+
+def assign(affinity, conflicts, per_paper, loads):
+    """
+    papers x reviewers bool matrix of the best assignment, conflicts being
+    a papers x reviewers bool matrix too.
+    """
+    return Assignment(affinity, conflicts, per_paper, loads).solve()
+
+
+def write_assignment(assignment_csv, pids, emails, assigned, review_type):
+    with open(assignment_csv, 'w') as f:
+        f.write(ASSIGNMENT_HEADER)
+        for row, col in zip(*np.nonzero(assigned)):
+            f.write("%d,%s,%s\n" % (pids[row], review_type, emails[col]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("affinity_csv",
+                        help="Affinity csv (--out-affinity of "
+                        "paper_affinity.py)")
+    parser.add_argument("out_assignment", help="HotCRP assignment csv")
+    parser.add_argument("--conflicts", nargs='*', default=[],
+                        help="Cross-reference reports, only the conflicts "
+                        "marked as valid are used")
+    parser.add_argument("--conflict-matrix",
+                        help="Conflict matrix saved by conflict_matrix.py, "
+                        "instead of the reports")
+    parser.add_argument("--reviewers-per-paper", type=int, default=3)
+    parser.add_argument("--max-load", type=int,
+                        help="Most papers per reviewer, as balanced as "
+                        "possible by default")
+    parser.add_argument("--review-type", default="primary",
+                        help="HotCRP assignment type of the reviews")
+    args = parser.parse_args()
+
+    pids, emails, affinity = read_affinity(args.affinity_csv)
+    if args.conflict_matrix:
+        matrix = ConflictMatrix.load(args.conflict_matrix)
+    else:
+        matrix = ConflictMatrix.from_reports(args.conflicts)
+    conflicts = matrix.reindex(pids, emails)
+
+    max_load = args.max_load or ceil(len(pids) * args.reviewers_per_paper /
+                                     max(len(emails), 1))
+    assigned = assign(affinity, conflicts, args.reviewers_per_paper,
+                      [max_load] * len(emails))
+
+    short = [pid for pid, n in zip(pids, assigned.sum(axis=1))
+             if n < args.reviewers_per_paper]
+    total = int(affinity[assigned].sum())
+    print("Assigned %d reviews, total affinity %d" %
+          (assigned.sum(), total))
+    if short:
+        print("WARNING: papers with fewer than %d reviewers: %s" %
+              (args.reviewers_per_paper, ", ".join(str(p) for p in short)))
+    write_assignment(args.out_assignment, pids, emails, assigned,
+                     args.review_type)
+
+
+if __name__ == '__main__':
+    main()
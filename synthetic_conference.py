@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+    Generates a synthetic conference to test and benchmark the COI
+    pipeline:
+        - submissions.json: HotCRP submissions export
+        - pc_info.csv: HotCRP PC info export
+        - pc_papers.csv: filtered PC paper list (dblp_crawler paper-lists)
+        - dblp_cache.db: recorded DBLP responses for the PC papers
+        - institutions.csv: copy of the institutions csv
+
+    Authors belong to research circles around PC members, so submissions
+    and PC members share co-authors, institutions and papers the same way
+    they do in a real conference.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+from shutil import copyfile
+import unidecode
+from util import iterate_csv
+from dblp_crawler import Cache
+from dblp_dump import person_key
+
+FIRST_NAMES = ['Mario', 'Mark', 'Babak', 'Wei', 'Xin', 'Li', 'Yuki',
+               'Hiroshi', 'Anne', 'Maria', 'José', 'Jürgen', 'François',
+               'Zoë', 'Ahmed', 'Fatima', 'Lars', 'Olga', 'Paolo', 'Ravi',
+               'Priya', 'Chen', 'David', 'Sarah', 'Michael', 'Emma', 'Ivan',
+               'Sung-Min', 'Jae', 'Ana', 'Luis', 'Thomas', 'Onur', 'Ayşe',
+               'Dimitrios', 'Eleni', 'Kai', 'Nikolai', 'Rachel', 'Daniel']
+LAST_NAMES = ['Drumond', 'Sutherland', 'Falsafi', 'Wang', 'Zhang', 'Li',
+              'Tanaka', 'Sato', 'Smith', 'Garcia', 'García-Molina',
+              'Müller', 'Dubois', "O'Brien", 'Khan', 'Larsen', 'Ivanova',
+              'Rossi', 'Patel', 'Nguyen', 'Cohen', 'Kim', 'Park', 'Silva',
+              'Wenisch', 'Mutlu', 'Yılmaz', 'Papadopoulos', 'Novak',
+              'Schmidt', 'Brown', 'Lopez', 'Chen', 'Liu', 'Kumar', 'Singh',
+              'Ferreira', 'Jensen', 'Kowalski', 'Levy']
+TOPICS = ['Accelerators', 'Caches', 'Memory systems', 'Interconnects',
+          'Datacenters', 'Security', 'Energy efficiency', 'GPUs',
+          'Reliability', 'Simulation', 'Storage', 'Quantum computing']
+VENUES = ['isca', 'micro', 'hpca', 'asplos', 'sigmetrics', 'sc']
+
+
+class Person(object):
+    """ HotCRP knows first and last, DBLP adds the homonym number """
+    def __init__(self, first, last, number, affiliation):
+        self.first = first
+        self.last = last
+        self.number = number
+        self.affiliation = affiliation
+        self.key = person_key(self.name)
+
+    @property
+    def name(self):
+        if self.number:
+            return "%s %s %04d" % (self.first, self.last, self.number)
+        return "%s %s" % (self.first, self.last)
+
+    @property
+    def email(self):
+        email = "%s.%s%s@%s.edu" % (self.first, self.last,
+                                    self.number or '',
+                                    self.affiliation.split()[0])
+        return unidecode.unidecode(email).lower()
+
+
+def xml_text(s):
+    """ DBLP answers in ASCII, with character references """
+    return (s.replace('&', '&amp;').replace('<', '&lt;')
+            .encode('ascii', 'xmlcharrefreplace').decode('ascii'))
+
+
+def publication_documents(key, title, year, authors):
+    xml = ('<?xml version="1.0" encoding="US-ASCII"?>\n<dblp>'
+           '<inproceedings key="%s" mdate="2018-01-01">%s<title>%s</title>'
+           '<year>%d</year><booktitle>%s</booktitle></inproceedings></dblp>' %
+           (key, ''.join('<author>%s</author>' % xml_text(a.name)
+                         for a in authors),
+            xml_text(title), year, key.split('/')[1].upper()))
+    rdf = ('<?xml version="1.0" encoding="US-ASCII"?>\n'
+           '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" '
+           'xmlns:dblp="https://dblp.org/rdf/schema-2017-04-18#">'
+           '<dblp:Publication rdf:about="https://dblp.org/rec/%s"/>'
+           '<dblp:Publication rdf:about="https://dblp.org/rec/%s">%s'
+           '</dblp:Publication></rdf:RDF>' %
+           (key, key, ''.join('<dblp:authoredBy rdf:resource='
+                              '"http://dblp.org/pers/%s"/>' % a.key
+                              for a in authors)))
+    return xml.encode('ascii'), rdf.encode('ascii')
+
+
+class SyntheticConference(object):
+    def __init__(self, n_papers, n_pc_members, institutions_csv, seed=0,
+                 first_year=2008, last_year=2018):
+        self.rand = random.Random(seed)
+        self.first_year = first_year
+        self.last_year = last_year
+        self.institutions = [[a for a in row if a and ',' not in a and
+                              '(' not in a]
+                             for row in iterate_csv(institutions_csv)]
+        self.institutions = [row for row in self.institutions if row]
+        self.unknown_institutions = ['%s %s Laboratory' %
+                                     (self.rand.choice(LAST_NAMES), t)
+                                     for t in TOPICS]
+
+        self.people = self.gen_people(max(500, 3 * n_papers +
+                                          10 * n_pc_members))
+        self.pc_members = self.rand.sample(self.people, n_pc_members)
+        self.circles = {p.key: self.rand.sample(self.people, 30)
+                        for p in self.pc_members}
+        self.publications = self.gen_publications()
+        self.submissions = [self.gen_submission(pid)
+                            for pid in range(1, n_papers + 1)]
+
+    def affiliation(self):
+        if self.rand.random() < 0.1:
+            return self.rand.choice(self.unknown_institutions)
+        return self.rand.choice(self.rand.choice(self.institutions)).strip()
+
+    def gen_people(self, n):
+        people = []
+        names = {}
+        for _ in range(n):
+            first = self.rand.choice(FIRST_NAMES)
+            last = self.rand.choice(LAST_NAMES)
+            # Homonyms get DBLP numbers
+            n_homonyms = names.get((first, last), 0)
+            names[(first, last)] = n_homonyms + 1
+            people.append(Person(first, last, n_homonyms,
+                                 self.affiliation()))
+        return people
+
+    def gen_publications(self):
+        """ [(key, title, year, authors)], authors include a PC member """
+        publications = []
+        for pc in self.pc_members:
+            circle = self.circles[pc.key]
+            for _ in range(self.rand.randint(5, 40)):
+                authors = [pc] + self.rand.sample(circle,
+                                                  self.rand.randint(0, 6))
+                if self.rand.random() < 0.1:
+                    authors.append(self.rand.choice(self.pc_members))
+                authors = list({a.key: a for a in authors}.values())
+                self.rand.shuffle(authors)
+                year = self.rand.randint(self.first_year, self.last_year)
+                key = "conf/%s/%s%d-%d" % (
+                    self.rand.choice(VENUES),
+                    unidecode.unidecode(authors[0].last)[:8],
+                    year % 100, len(publications))
+                title = "On %s and %s %d" % (self.rand.choice(TOPICS),
+                                             self.rand.choice(TOPICS).lower(),
+                                             len(publications))
+                publications.append((key, title, year, authors))
+        return publications
+
+    def collaborators(self, circle):
+        lines = []
+        for _ in range(self.rand.randint(0, 12)):
+            if self.rand.random() < 0.7:
+                p = self.rand.choice(circle)
+                lines.append("%s %s, %s" % (p.first, p.last, p.affiliation))
+            else:
+                lines.append(self.affiliation())
+        return "\n".join(lines)
+
+    def gen_submission(self, pid):
+        # Most submissions come from the circle of some PC member
+        pc = self.rand.choice(self.pc_members)
+        pool = self.circles[pc.key] + self.rand.sample(self.people, 20)
+        authors = self.rand.sample(pool, self.rand.randint(1, 8))
+        if self.rand.random() < 0.05:
+            authors.append(pc)
+        pc_conflicts = {}
+        if self.rand.random() < 0.5:
+            pc_conflicts[pc.email] = "collaborator"
+        for p in self.rand.sample(self.pc_members,
+                                  self.rand.randint(0, 3)):
+            pc_conflicts[p.email] = "other"
+
+        return {'pid': pid,
+                'title': "Submission %d on %s" % (pid,
+                                                  self.rand.choice(TOPICS)),
+                'authors': [{'first': a.first, 'last': a.last,
+                             'email': a.email,
+                             'affiliation': a.affiliation}
+                            for a in authors],
+                'abstract': ' '.join(self.rand.choice(TOPICS)
+                                     for _ in range(100)),
+                'topics': self.rand.sample(TOPICS, self.rand.randint(1, 3)),
+                'pc_conflicts': pc_conflicts,
+                'collaborators': self.collaborators(pool)}
+
+    def write(self, out_dir, institutions_csv):
+        os.makedirs(out_dir, exist_ok=True)
+        copyfile(institutions_csv, os.path.join(out_dir, 'institutions.csv'))
+
+        with open(os.path.join(out_dir, 'submissions.json'), 'w',
+                  encoding='utf-8') as f:
+            json.dump(self.submissions, f, ensure_ascii=False)
+
+        with open(os.path.join(out_dir, 'pc_info.csv'), 'w', newline='',
+                  encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['first', 'last', 'email', 'roles', 'tags',
+                             'affiliation', 'collaborators', 'follow'] +
+                            TOPICS)
+            for pc in self.pc_members:
+                tags = self.rand.choice(['', '', '#double_conflict'])
+                writer.writerow([pc.first, pc.last, pc.email, 'pc', tags,
+                                 pc.affiliation,
+                                 self.collaborators(self.circles[pc.key]),
+                                 ''] +
+                                [self.rand.choice(['', '2', '-1'])
+                                 for _ in TOPICS])
+
+        with open(os.path.join(out_dir, 'pc_papers.csv'), 'w', newline='',
+                  encoding='latin-1', errors='replace') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'id', 'first_name', 'last_name', 'keys',
+                             'valid', 'pub_key', 'pub_title', 'pub_year',
+                             'pub_authors'])
+            for idx, pc in enumerate(self.pc_members):
+                for key, title, year, authors in self.publications:
+                    if pc in authors:
+                        valid = 'x' if self.rand.random() < 0.9 else ''
+                        writer.writerow([pc.email, idx, pc.first, pc.last,
+                                         pc.key, valid, key, title, year,
+                                         ';'.join(a.name for a in authors)])
+
+        cache = Cache(os.path.join(out_dir, 'dblp_cache.db'))
+        queries = []
+        for key, title, year, authors in self.publications:
+            xml, rdf = publication_documents(key, title, year, authors)
+            queries.append(('rec/bibtex/%s.xml' % key, xml))
+            queries.append(('rec/rdf/%s.rdf' % key, rdf))
+        cache.add_queries(queries)
+        cache.close()
+
+
+def generate(out_dir, n_papers, n_pc_members, seed=0,
+             institutions_csv='data/institutions.csv'):
+    conference = SyntheticConference(n_papers, n_pc_members,
+                                     institutions_csv, seed)
+    conference.write(out_dir, institutions_csv)
+    return conference
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir", help="Folder for the generated files")
+    parser.add_argument("--papers", type=int, default=300,
+                        help="Number of submissions")
+    parser.add_argument("--pc-members", type=int, default=50,
+                        help="Number of PC members")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--institutions-csv", default='data/institutions.csv')
+    args = parser.parse_args()
+
+    conference = generate(args.out_dir, args.papers, args.pc_members,
+                          args.seed, args.institutions_csv)
+    print("Generated %d submissions, %d PC members and %d PC papers in %s" %
+          (len(conference.submissions), len(conference.pc_members),
+           len(conference.publications), args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conflict_matrix import ConflictMatrix, read_report_conflicts
+
+
+def test_report_with_blank_rows(tmp_path):
+    report = tmp_path / "report.csv"
+    report.write_text("valid,pid,email,reasons\n"
+                      "x,1,a@x.org,reason\n"
+                      "\n"
+                      ",2,b@x.org,\n"
+                      "x,3\n"
+                      "x,3,b@x.org,\n"
+                      "\n")
+    assert read_report_conflicts([str(report)]) == {(1, 'a@x.org'),
+                                                    (3, 'b@x.org')}
+
+    matrix = ConflictMatrix.from_reports([str(report)])
+    assert (1, 'a@x.org') in matrix
+    assert (2, 'b@x.org') not in matrix
+    assert len(matrix) == 2
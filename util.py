@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import json
 import csv
+from itertools import islice
 import unidecode
 
 def copy_dic(in_dic, out_dic, schema):
@@ -8,22 +9,55 @@ def copy_dic(in_dic, out_dic, schema):
         out_dic[k] = in_dic[k]
 
 
-def iterate_csv(filename, encoding=""):
+# Rows per batch of iterate_csv_batches
+CSV_BATCH_SIZE = 1024
+
+
+def transliterate(cell):
+    """ unidecode, skipping the (most common) cells that are ASCII already """
+    return cell if cell.isascii() else unidecode.unidecode(cell)
+
+
+def iterate_csv(filename, encoding="", columns=None):
+    """
+    Rows of a csv file, header excluded, transliterated to ASCII. If
+    columns (indices) is given, rows only have those cells, in that order,
+    and the other cells are not transliterated.
+    """
     if not encoding:
         encoding = 'latin-1'
     with open(filename, newline='', encoding=encoding) as csvfile:
         csv_it = csv.reader(csvfile)
         next(csv_it, None)
         for r in csv_it:
-            yield [unidecode.unidecode(i) for i in r]
+            if columns is not None:
+                r = [r[c] if c < len(r) else '' for c in columns]
+            yield [transliterate(i) for i in r]
+
+
+def iterate_csv_batches(filename, batch_size=CSV_BATCH_SIZE, encoding="",
+                        columns=None):
+    """ Same rows as iterate_csv, in lists of up to batch_size rows """
+    rows = iterate_csv(filename, encoding, columns)
+    batch = list(islice(rows, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, batch_size))
 
 
-def read_csv(filename, schema):
+def read_csv(filename, schema, fields=None):
+    """
+    Rows of a csv file with an id column followed by the schema columns,
+    as dicts. If fields is given, only those columns are read.
+    """
+    if fields is None:
+        fields = schema
+    columns = [0] + [schema.index(k) + 1 for k in fields]
     result = []
-    for row in iterate_csv(filename):
+    for row in iterate_csv(filename, columns=columns):
         idx = int(row[0])
         r = {'id': idx}
-        for k, v in zip(schema, row[1:]):
+        for k, v in zip(fields, row[1:]):
             r[k] = v
         result.append(r)
     return result
@@ -53,6 +87,55 @@ def get_dict_json(json_file):
 
     return d
 
+def unidecode_json(value):
+    """ Transliterates the strings (keys included) of a parsed JSON value """
+    if isinstance(value, str):
+        return unidecode.unidecode(value)
+    if isinstance(value, list):
+        return [unidecode_json(v) for v in value]
+    if isinstance(value, dict):
+        return {unidecode_json(k): unidecode_json(v)
+                for k, v in value.items()}
+    return value
+
+
+def iterate_json_list(json_file, fields=None, chunk_size=1 << 16):
+    """
+    Yields the objects of a JSON list (e.g., a HotCRP export) one at a
+    time, reading the file in chunks. Only the given fields are kept, and
+    transliterated like get_dict_json does.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8') as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith('['):
+            raise ValueError("%s is not a JSON list" % json_file)
+        pos = 1
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                # The object is cut at the end of the buffer: read at least
+                # as much again, so long objects are not parsed many times
+                more = f.read(max(chunk_size, len(buf) - pos))
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+
+            if fields is not None:
+                obj = {k: obj[k] for k in fields if k in obj}
+            yield unidecode_json(obj)
+            pos = end
+
+
 def save_dict_json(json_file,save_me):
     with open(json_file,'w',encoding='utf-8') as f:
         json.dump(save_me,f)